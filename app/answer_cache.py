@@ -0,0 +1,108 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from app.config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES
+
+
+def normalize_question(question):
+    return " ".join(question.lower().split())
+
+
+def document_id(document):
+    # Ưu tiên id ổn định của chunk, nếu không có thì băm nội dung + metadata
+    chunk_id = document.metadata.get("chunk_id") or getattr(document, "id", None)
+    if chunk_id:
+        return str(chunk_id)
+    raw = "\x1f".join([
+        str(document.metadata.get("program")),
+        str(document.metadata.get("article_title")),
+        document.page_content,
+    ])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    # Cache câu trả lời LLM trên SQLite, khoá theo câu hỏi đã chuẩn hoá + prompt + model + các chunk được truy xuất
+    def __init__(self, path, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_access ON answers(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question, documents, prompt_version, model):
+        chunk_ids = sorted(document_id(doc) for doc in documents)
+        raw = "\x1e".join([normalize_question(question), prompt_version, model, "\x1f".join(chunk_ids)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, answer):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        # Xoá bản ghi hết hạn, sau đó bỏ bớt bản ghi ít dùng nhất nếu vượt max_entries
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+        print("🧹 Đã xoá cache câu trả lời")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES) if ANSWER_CACHE_ENABLED else None
@@ -5,8 +5,9 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 import os
 import json
-from app.qa_chain import create_qa_chain, answer_question
-from app.document_processor import process_document, setup_pinecone_index, extract_structured_terms
+import multiprocessing
+from app.qa_chain import get_qa_chain, answer_question, answer_questions_batch, embed_questions, warm_up, create_retrieval_plan
+from app.document_processor import process_document, setup_pinecone_index, extract_structured_terms, close_ingest_embeddings, embedding_cache
 from typing import List, Dict, Optional
 import tempfile
 from docx import Document
@@ -17,6 +18,19 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+from fastapi.responses import StreamingResponse
+import asyncio
+from app.config import QA_MAX_WORKERS, IO_WORKERS, CPU_WORKERS, BATCH_CLAUSES, BATCH_MAX_CLAUSES, RETRIEVAL_POOL_LEVEL
+from app.jobs import job_manager, JobCancelled
+from app.answer_cache import answer_cache
+from app.semantic_cache import semantic_cache
+from app.loaders import extract_cache
+from app.bm25_index import get_bm25_index
+from app.article_index import get_article_index
+from app.reranker import get_reranker
+from app.context_builder import context_builder
 
 # Cấu hình JWT
 SECRET_KEY = "your-secret-key"  # Thay đổi thành một key bảo mật trong môi trường production
@@ -65,6 +79,38 @@ app.add_middleware(
     allow_headers=["*"],  # Cho phép tất cả các headers
 )
 
+# Executor cho các tác vụ chặn (file I/O, bcrypt, Pinecone, embedding) và process pool cho phần parse nặng CPU,
+# để event loop không bị treo khi có job dài
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+# /learn chạy tuần tự trên một luồng riêng để các lần nạp văn bản không ghi đè lên nhau
+learn_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="learn")
+# spawn thay vì fork: process cha đã có model embedding và các thread pool trên (job thread gửi trang PDF
+# sang pool này), fork lúc các luồng đó đang giữ khoá có thể làm process con bị treo
+cpu_executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+async def run_in_executor(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+def save_file(file_path, content):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as buffer:
+        buffer.write(content)
+
+@app.on_event("startup")
+async def warm_up_qa_chain():
+    try:
+        await run_in_executor(io_executor, warm_up)
+    except Exception as e:
+        # Không chặn server khởi động, chain sẽ được dựng lại ở job đầu tiên
+        print(f"Warm-up QA chain thất bại: {str(e)}")
+
+@app.on_event("shutdown")
+def save_caches():
+    if semantic_cache:
+        semantic_cache.save()
+    close_ingest_embeddings()
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -116,7 +162,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 
 @app.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+    # bcrypt tốn CPU nên chạy ngoài event loop
+    user = await run_in_executor(io_executor, authenticate_user, fake_users_db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -129,10 +176,14 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-def process_json(data, qa):
+def process_json(data, qa, max_workers=QA_MAX_WORKERS, job=None, batch_clauses=BATCH_CLAUSES):
     results = []
     #Copy file output.json
     document = []
+    # Các mục lá (cần hỏi LLM) theo đúng thứ tự duyệt cây: (sentence, question, node, group)
+    leaves = []
+    # Nhóm truy xuất của từng mục lá: cả Điều, hoặc mục 1.1 (nếu có mục con) khi RETRIEVAL_POOL_LEVEL = "sub_item"
+    leaf_pools = []
     #Mỗi lần lưu result thì sẽ thêm answer vào document ở mục cuối cùng đang chạy đến trong output.json
     def group_by_program(documents):
         result = defaultdict(list)
@@ -141,6 +192,15 @@ def process_json(data, qa):
                 "title": item.metadata.get('article_title'), 
                 "text": item.page_content})
         return dict(result)
+
+    def add_leaf(title, sentence, question, group, pool):
+        # answer/documents sẽ được điền sau khi đánh giá song song xong.
+        # group là mục cha, các mục lá cùng cha có thể được gộp vào một lượt gọi LLM;
+        # các mục lá cùng pool dùng chung một tập ứng viên truy xuất
+        node = {"title": title}
+        leaves.append((sentence, question, node, group))
+        leaf_pools.append(pool)
+        return node
     
     def process_item(item, parent_title=""):
         title = item.get("title", "")
@@ -149,19 +209,7 @@ def process_json(data, qa):
         sub_items = item.get("sub_items", [])
 
         if not sub_items:
-            answer, documents = answer_question(full_title, qa)
-            grouped_documents = group_by_program(documents)
-            results.append({
-                "sentence": sentence,
-                "question": full_title,
-                "answer": answer,
-                "documents": grouped_documents
-            })
-            document.append({
-                "title": title,
-                "answer": answer,
-                "documents": grouped_documents
-            })
+            document.append(add_leaf(title, sentence, full_title, id(item), id(item)))
         else:
             processed_sub_items = []
             for sub in sub_items:
@@ -170,59 +218,24 @@ def process_json(data, qa):
                 full_sub_title = f"{full_title} > {sub_title}"
                 details = sub.get("details", [])
                 if not details:
-                    answer, documents = answer_question(full_sub_title, qa)
-                    grouped_documents = group_by_program(documents)
-                    results.append({
-                        "sentence": sub_sentence,
-                        "question": full_sub_title,
-                        "answer": answer,
-                        "documents": grouped_documents
-                    })
-                    processed_sub_items.append({
-                        "title": sub_title,
-                        "answer": answer,
-                        "documents": grouped_documents
-                    })
+                    processed_sub_items.append(add_leaf(sub_title, sub_sentence, full_sub_title, id(item), id(item)))
                 else:
                     processed_details = []
+                    sub_pool = id(sub) if RETRIEVAL_POOL_LEVEL == "sub_item" else id(item)
                     for detail in details:
                         detail_title = detail.get("title", "")
                         detail_sentence = f"{sub_sentence}\n{detail_title}"
                         full_detail_title = f"{full_sub_title} > {detail_title}"
                         sub_details = detail.get("sub_details", [])
                         if not sub_details:
-                            answer, documents = answer_question(full_detail_title, qa)
-                            grouped_documents = group_by_program(documents)
-                            results.append({
-                                "sentence": detail_sentence,
-                                "question": full_detail_title,
-                                "answer": answer,
-                                "documents": grouped_documents
-                            })
-                            processed_details.append({
-                                "title": detail_title,
-                                "answer": answer,
-                                "documents": grouped_documents
-                            })
+                            processed_details.append(add_leaf(detail_title, detail_sentence, full_detail_title, id(sub), sub_pool))
                         else:
                             processed_sub_details = []
                             for sub_detail in sub_details:
                                 sub_detail_title = sub_detail.get("title", "")
                                 sub_detail_sentence = f"{detail_sentence}\n{sub_detail_title}"
                                 full_sub_detail_title = f"{full_detail_title} > {sub_detail_title}"
-                                answer, documents = answer_question(full_sub_detail_title, qa)
-                                grouped_documents = group_by_program(documents)
-                                results.append({
-                                    "sentence": sub_detail_sentence,
-                                    "question": full_sub_detail_title,
-                                    "answer": answer,
-                                    "documents": grouped_documents
-                                })
-                                processed_sub_details.append({
-                                    "title": sub_detail_title,
-                                    "answer": answer,
-                                    "documents": grouped_documents
-                                })
+                                processed_sub_details.append(add_leaf(sub_detail_title, sub_detail_sentence, full_sub_detail_title, id(detail), sub_pool))
                             processed_details.append({
                                 "title": detail_title,
                                 "sub_details": processed_sub_details
@@ -236,13 +249,91 @@ def process_json(data, qa):
                 "sub_items": processed_sub_items
             })
 
+    def evaluate(task):
+        if job:
+            job.raise_if_cancelled()
+        questions = [leaves[index][1] for index in task]
+        task_vectors = [vectors[index] for index in task]
+        task_pools = [plan.pool(index) if plan else None for index in task]
+        if len(questions) > 1:
+            outputs = answer_questions_batch(questions, qa, task_vectors, task_pools)
+        else:
+            outputs = [answer_question(questions[0], qa, task_vectors[0], task_pools[0])]
+        return [(answer, group_by_program(documents), cached) for answer, documents, cached in outputs]
+
     # Xử lý từng item trong danh sách
     if isinstance(data, list):
         for item in data:
             process_item(item)
     else:
         process_item(data)
-    
+
+    if job:
+        job.set_total(len(leaves))
+
+    # Embed mọi câu hỏi một lần theo lô, vector được dùng thẳng cho tìm kiếm
+    vectors = embed_questions([leaf[1] for leaf in leaves])
+    plan = create_retrieval_plan(qa)
+    if plan:
+        for index, vector in enumerate(vectors):
+            plan.add(index, leaf_pools[index], vector)
+
+    # Mỗi task là danh sách chỉ số mục lá: một mục, hoặc các mục anh em khi bật gộp điều khoản
+    if batch_clauses:
+        groups = {}
+        for index, leaf in enumerate(leaves):
+            groups.setdefault(leaf[3], []).append(index)
+        tasks = [indexes[i:i + BATCH_MAX_CLAUSES]
+                 for indexes in groups.values()
+                 for i in range(0, len(indexes), max(1, BATCH_MAX_CLAUSES))]
+    else:
+        tasks = [[index] for index in range(len(leaves))]
+    positions = {}
+    for task_index, task in enumerate(tasks):
+        for position, index in enumerate(task):
+            positions[index] = (task_index, position)
+
+    # Đánh giá song song các mục lá, kết quả được ghép lại theo đúng thứ tự ban đầu
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = [executor.submit(evaluate, task) for task in tasks]
+        if job:
+            def on_done(future):
+                if not future.cancelled() and future.exception() is None:
+                    job.clause_done(len(future.result()))
+            for future in futures:
+                future.add_done_callback(on_done)
+        for index, (sentence, question, node, group) in enumerate(leaves):
+            task_index, position = positions[index]
+            future = futures[task_index]
+            while True:
+                try:
+                    answer, grouped_documents, cached = future.result(timeout=0.5)[position]
+                    break
+                except FutureTimeoutError:
+                    if job:
+                        job.raise_if_cancelled()
+            entry = {
+                "sentence": sentence,
+                "question": question,
+                "answer": answer,
+                "documents": grouped_documents
+            }
+            if cached:
+                entry["cached"] = cached
+            results.append(entry)
+            node["answer"] = answer
+            node["documents"] = grouped_documents
+            if job:
+                job.add_result(entry)
+    finally:
+        # Nếu có lỗi hoặc job bị huỷ thì không chạy các câu hỏi còn lại trong hàng đợi
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if plan:
+        stats = plan.stats()
+        print(f"🔎 Truy xuất: {stats['pool_queries']} truy vấn tập ứng viên cho {stats['pooled_leaves']} mục lá, "
+              f"{stats['leaves'] - stats['pooled_leaves']} mục lá truy xuất riêng")
     return results, document
 
 @app.post("/uploadVBPL")
@@ -257,11 +348,9 @@ async def upload_fileVBPL(
         )
     try:
         temp_dir = "VBPL"
-        os.makedirs(temp_dir, exist_ok=True)
         file_path = os.path.join(temp_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        content = await file.read()
+        await run_in_executor(io_executor, save_file, file_path, content)
         
         return {
             "message": "File uploaded successfully",
@@ -294,13 +383,20 @@ async def learn_file(
         if not file_path.lower().endswith(('.pdf', '.docx')):
             raise HTTPException(status_code=400, detail="Only PDF and DOCX files are supported")
         
-        process_document(file_path)
+        stats = await run_in_executor(learn_executor, process_document, file_path)
+        # Chỉ mục đã thay đổi nên các câu trả lời đã cache không còn đáng tin
+        if stats["added"] or stats["removed"] or stats["legacy_removed"]:
+            if answer_cache:
+                await run_in_executor(io_executor, answer_cache.clear)
+            if semantic_cache:
+                await run_in_executor(io_executor, semantic_cache.clear)
         
         end_time = time.time()
         processing_time = end_time - start_time
         
         return {
-            "message": "File processed successfully"
+            "message": "File processed successfully",
+            "indexing": stats
         }
     except HTTPException as he:
         raise he
@@ -313,15 +409,11 @@ async def upload_file(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        # Create temp directory if it doesn't exist
-        temp_dir = "temp"
-        os.makedirs(temp_dir, exist_ok=True)
-        
         # Save uploaded file
+        temp_dir = "temp"
         file_path = os.path.join(temp_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        content = await file.read()
+        await run_in_executor(io_executor, save_file, file_path, content)
         
         return {
             "message": "File uploaded successfully",
@@ -331,6 +423,109 @@ async def upload_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi upload file: {str(e)}")
 
+@app.get("/cache/stats")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    bm25_index = get_bm25_index()
+    article_index = get_article_index()
+    reranker = get_reranker()
+    return {
+        "answers": answer_cache.stats() if answer_cache else None,
+        "semantic": semantic_cache.stats() if semantic_cache else None,
+        "embeddings": embedding_cache.stats() if embedding_cache else None,
+        "extracted": extract_cache.stats() if extract_cache else None,
+        "bm25": bm25_index.stats() if bm25_index is not None else None,
+        "articles": article_index.stats() if article_index is not None else None,
+        "rerank": reranker.stats() if reranker is not None else None,
+        "context": context_builder.stats() if context_builder else None
+    }
+
+def run_process_job(job, file_path, start_page, end_page):
+    start_time = time.time()
+
+    # Gọi hàm xử lý văn bản
+    try:
+        # Đọc text các trang PDF dài song song trên process pool, parse ngay trong luồng job theo từng trang
+        structured_terms = extract_structured_terms(file_path, start_page, end_page, executor=cpu_executor)
+    except Exception as e:
+        print(f"Error extracting structured terms: {str(e)}")
+        raise Exception(f"Error processing file: {str(e)}")
+    if not structured_terms:
+        raise Exception("No content found in the specified page range")
+    job.raise_if_cancelled()
+
+    # Lưu kết quả trung gian vào thư mục temp
+    temp_dir = "json_output"
+    os.makedirs(temp_dir, exist_ok=True)
+    output_json = os.path.join(temp_dir, "output.json")
+    
+    with open(output_json, "w", encoding="utf-8") as f:
+        json.dump(structured_terms, f, ensure_ascii=False, indent=2)
+
+    # Tạo chuỗi hỏi đáp
+    try:
+        qa_chain = get_qa_chain()
+    except Exception as e:
+        print(f"Error creating QA chain: {str(e)}")
+        raise Exception(f"Error creating QA chain: {str(e)}")
+
+    # Xử lý dữ liệu JSON
+    try:
+        results, document = process_json(structured_terms, qa_chain, job=job)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        print(f"Error processing JSON data: {str(e)}")
+        raise Exception(f"Error processing JSON data: {str(e)}")
+    if not results:
+        raise Exception("No results generated from the content")
+    if semantic_cache:
+        semantic_cache.save()
+
+    # Lưu kết quả cuối cùng vào thư mục output
+    output_dir = "output"
+    os.makedirs(output_dir, exist_ok=True)
+
+    document_dir = "document"
+    os.makedirs(document_dir, exist_ok=True)
+
+    # Lấy tên file gốc
+    original_filename = os.path.basename(file_path)
+    # Tạo timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Tạo tên file kết quả
+    document_filename = f"{os.path.splitext(original_filename)[0]}_{timestamp}.json"
+    document_json = os.path.join(document_dir, document_filename)
+    
+    results_filename = f"{os.path.splitext(original_filename)[0]}_{timestamp}.json"
+    results_json = os.path.join(output_dir, results_filename)
+    # Tính thời gian xử lý
+    end_time = time.time()
+    processing_time = end_time - start_time
+
+    # Thêm thời gian xử lý vào kết quả
+    results.append({"process_time": processing_time})
+    
+    try:
+        with open(results_json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        with open(document_json, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Error writing results file: {str(e)}")
+        raise Exception(f"Error writing results file: {str(e)}")
+    
+    return {
+        "results": results,
+        "processing_time": processing_time,
+        "filename": results_filename
+    }
+
+def get_user_job(job_id: str, current_user: User):
+    job = job_manager.get(job_id)
+    if not job or (job.owner != current_user.username and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.post("/process")
 async def process_file(
     file_path: str,
@@ -338,193 +533,288 @@ async def process_file(
     end_page: int,
     current_user: User = Depends(get_current_user)
 ):
-    try:
-        start_time = time.time()
-        # Convert URL-encoded path back to normal path
-        file_path = file_path.replace("%2F", "/")
-        
-        # Kiểm tra file tồn tại
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
-
-        # Kiểm tra file có phải là PDF hoặc DOCX không
-        if not file_path.lower().endswith(('.pdf', '.docx')):
-            raise HTTPException(status_code=400, detail="Only PDF and DOCX files are supported")
-
-        # Kiểm tra số trang hợp lệ
-        if start_page < 1 or end_page < start_page:
-            raise HTTPException(status_code=400, detail="Invalid page range")
-
-        # Gọi hàm xử lý văn bản
-        try:
-            structured_terms = extract_structured_terms(file_path, start_page, end_page)
-            if not structured_terms:
-                raise HTTPException(status_code=400, detail="No content found in the specified page range")
-        except Exception as e:
-            print(f"Error extracting structured terms: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
-
-        # Lưu kết quả trung gian vào thư mục temp
-        temp_dir = "json_output"
-        os.makedirs(temp_dir, exist_ok=True)
-        output_json = os.path.join(temp_dir, "output.json")
-        
-        with open(output_json, "w", encoding="utf-8") as f:
-            json.dump(structured_terms, f, ensure_ascii=False, indent=2)
-
-        # Tạo chuỗi hỏi đáp
-        try:
-            qa_chain = create_qa_chain()
-        except Exception as e:
-            print(f"Error creating QA chain: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error creating QA chain: {str(e)}")
-
-        # Đọc dữ liệu đã trích xuất
-        try:
-            with open(output_json, "r", encoding="utf-8") as f:
-                json_data = json.load(f)
-        except Exception as e:
-            print(f"Error reading output file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error reading output file: {str(e)}")
-
-        # Xử lý dữ liệu JSON
-        try:
-            results, document = process_json(json_data, qa_chain)
-            if not results:
-                raise HTTPException(status_code=400, detail="No results generated from the content")
-        except Exception as e:
-            print(f"Error processing JSON data: {str(e)}")
-            print(f"JSON data: {json.dumps(json_data, indent=2)}")
-            raise HTTPException(status_code=500, detail=f"Error processing JSON data: {str(e)}")
-
-        # Lưu kết quả cuối cùng vào thư mục output
-        output_dir = "output"
-        os.makedirs(output_dir, exist_ok=True)
-
-        document_dir = "document"
-        os.makedirs(document_dir, exist_ok=True)
-
-        # print(document)
-        
-        # Lấy tên file gốc
-        original_filename = os.path.basename(file_path)
-        # Tạo timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # Tạo tên file kết quả
-        document_filename = f"{os.path.splitext(original_filename)[0]}_{timestamp}.json"
-        document_json = os.path.join(document_dir, document_filename)
-        
-        results_filename = f"{os.path.splitext(original_filename)[0]}_{timestamp}.json"
-        results_json = os.path.join(output_dir, results_filename)
-        # Tính thời gian xử lý
-        end_time = time.time()
-        processing_time = end_time - start_time
+    # Convert URL-encoded path back to normal path
+    file_path = file_path.replace("%2F", "/")
+    
+    # Kiểm tra file tồn tại
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+
+    # Kiểm tra file có phải là PDF hoặc DOCX không
+    if not file_path.lower().endswith(('.pdf', '.docx')):
+        raise HTTPException(status_code=400, detail="Only PDF and DOCX files are supported")
+
+    # Kiểm tra số trang hợp lệ
+    if start_page < 1 or end_page < start_page:
+        raise HTTPException(status_code=400, detail="Invalid page range")
+
+    # Đưa vào hàng đợi, client theo dõi tiến độ qua /jobs/{job_id}
+    job = job_manager.submit(
+        lambda job: run_process_job(job, file_path, start_page, end_page),
+        owner=current_user.username,
+        params={"file_path": file_path, "start_page": start_page, "end_page": end_page}
+    )
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs")
+async def list_jobs(current_user: User = Depends(get_current_user)):
+    owner = None if current_user.role == "admin" else current_user.username
+    jobs = sorted(job_manager.list(owner), key=lambda job: job.created_at, reverse=True)
+    return [job.to_dict() for job in jobs]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = get_user_job(job_id, current_user)
+    response = job.to_dict()
+    if job.status == "completed":
+        response["result"] = job.result
+    return response
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    offset: int = 0,
+    current_user: User = Depends(get_current_user)
+):
+    job = get_user_job(job_id, current_user)
+    return {
+        "status": job.status,
+        "offset": offset,
+        "results": job.get_results(offset)
+    }
 
-        # Thêm thời gian xử lý vào kết quả
-        results.append({"process_time": processing_time})
-        
-        try:
-            with open(results_json, "w", encoding="utf-8") as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            with open(document_json, "w", encoding="utf-8") as f:
-                json.dump(document, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error writing results file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error writing results file: {str(e)}")
+@app.get("/jobs/{job_id}/stream")
+async def stream_job_results(job_id: str, current_user: User = Depends(get_current_user)):
+    job = get_user_job(job_id, current_user)
+
+    # Trả từng kết quả (NDJSON) ngay khi có, dòng cuối là trạng thái job
+    async def event_stream():
+        offset = 0
+        while True:
+            finished = job.finished
+            for entry in job.get_results(offset):
+                offset += 1
+                yield json.dumps(entry, ensure_ascii=False) + "\n"
+            if finished:
+                break
+            await asyncio.sleep(0.5)
+        yield json.dumps(job.to_dict(), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = get_user_job(job_id, current_user)
+    job_manager.cancel(job_id)
+    return {"job_id": job.id, "status": "cancelling" if not job.finished else job.status}
+
+def list_process_results():
+    output_dir = "output"
+    if not os.path.exists(output_dir):
+        return []
         
-        return {
-            "results": results,
-            "processing_time": processing_time,
-            "filename": results_filename
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    results = []
+    for filename in os.listdir(output_dir):
+        if filename.endswith('.json'):
+            file_path = os.path.join(output_dir, filename)
+            modified_time = os.path.getmtime(file_path)
+            results.append({
+                "filename": filename,
+                "modified_time": modified_time
+            })
+    
+    # Sắp xếp theo thời gian sửa đổi mới nhất
+    results.sort(key=lambda x: x["modified_time"], reverse=True)
+    return results
 
 @app.get("/process-results")
 async def get_process_results():
     try:
-        output_dir = "output"
-        if not os.path.exists(output_dir):
-            return []
-            
-        results = []
-        for filename in os.listdir(output_dir):
-            if filename.endswith('.json'):
-                file_path = os.path.join(output_dir, filename)
-                modified_time = os.path.getmtime(file_path)
-                results.append({
-                    "filename": filename,
-                    "modified_time": modified_time
-                })
-        
-        # Sắp xếp theo thời gian sửa đổi mới nhất
-        results.sort(key=lambda x: x["modified_time"], reverse=True)
-        return results
+        return await run_in_executor(io_executor, list_process_results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def read_process_result(filename):
+    output_dir = "output"
+    document_dir = "document"
+
+    # Tìm file có chứa tên file gốc trong tên
+    matching_files = [f for f in os.listdir(output_dir) if filename in f and f.endswith('.json')]
+    matching_document_files = [f for f in os.listdir(document_dir) if filename in f and f.endswith('.json')]
+
+    if not matching_files:
+        raise HTTPException(status_code=404, detail="Result not found")
+    if not matching_document_files:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Lấy file đầu tiên khớp với tên file
+    results_file = os.path.join(output_dir, matching_files[0])
+    document_file = os.path.join(document_dir, matching_document_files[0])
+
+    try:
+        with open(results_file, "r", encoding="utf-8") as f:
+            results_data = json.load(f)
+    except Exception as e:
+        print(f"Error reading results file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error reading results file: {str(e)}")
+
+    try:
+        with open(document_file, "r", encoding="utf-8") as f:
+            document_data = json.load(f)
+    except Exception as e:
+        print(f"Error reading document file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error reading document file: {str(e)}")
+
+    # Kiểm tra xem results_data có phải là list và có phần tử cuối cùng không
+    if not isinstance(results_data, list) or not results_data:
+        raise HTTPException(status_code=500, detail="Invalid results data format")
+
+    # Kiểm tra xem phần tử cuối cùng có process_time không
+    last_result = results_data[-1]
+    if not isinstance(last_result, dict) or "process_time" not in last_result:
+        raise HTTPException(status_code=500, detail="Process time not found in results")
+
+    return {
+        "filename": filename,
+        "results": results_data,
+        "document": document_data,
+        "process_time": last_result["process_time"]
+    }
+
 @app.get("/process-results/{filename}")
 async def get_process_result(
     filename: str,
     current_user: User = Depends(get_current_user)
 ):
     try:
-        output_dir = "output"
-        document_dir = "document"
-        
-        # Tìm file có chứa tên file gốc trong tên
-        matching_files = [f for f in os.listdir(output_dir) if filename in f and f.endswith('.json')]
-        matching_document_files = [f for f in os.listdir(document_dir) if filename in f and f.endswith('.json')]
-        
-        if not matching_files:
-            raise HTTPException(status_code=404, detail="Result not found")
-        if not matching_document_files:
-            raise HTTPException(status_code=404, detail="Document not found")
-            
-        # Lấy file đầu tiên khớp với tên file
-        results_file = os.path.join(output_dir, matching_files[0])
-        document_file = os.path.join(document_dir, matching_document_files[0])
-        
-        try:
-            with open(results_file, "r", encoding="utf-8") as f:
-                results_data = json.load(f)
-                print("Raw results data:", results_data)  # Debug log
-        except Exception as e:
-            print(f"Error reading results file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error reading results file: {str(e)}")
-            
-        try:
-            with open(document_file, "r", encoding="utf-8") as f:
-                document_data = json.load(f)
-                print("Raw document data:", document_data)  # Debug log
-        except Exception as e:
-            print(f"Error reading document file: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error reading document file: {str(e)}")
-            
-        # Kiểm tra xem results_data có phải là list và có phần tử cuối cùng không
-        if not isinstance(results_data, list) or not results_data:
-            raise HTTPException(status_code=500, detail="Invalid results data format")
-            
-        # Kiểm tra xem phần tử cuối cùng có process_time không
-        last_result = results_data[-1]
-        if not isinstance(last_result, dict) or "process_time" not in last_result:
-            raise HTTPException(status_code=500, detail="Process time not found in results")
-            
-        return {
-            "filename": filename,
-            "results": results_data,
-            "document": document_data,
-            "process_time": last_result["process_time"]
-        }
+        return await run_in_executor(io_executor, read_process_result, filename)
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"Error reading results: {str(e)}")  # Debug log
         raise HTTPException(status_code=500, detail=f"Error reading results: {str(e)}")
 
+def build_docx(filename):
+    # Tìm file trong thư mục document
+    document_dir = "document"
+    matching_files = [f for f in os.listdir(document_dir) if f.endswith('.json') and filename in f]
+
+    if not matching_files:
+        print(f"No matching files found for: {filename}")
+        raise HTTPException(status_code=404, detail="Document file not found")
+
+    # Lấy file đầu tiên tìm thấy
+    document_file = matching_files[0]
+    json_path = os.path.join(document_dir, document_file)
+    print(f"Found matching file: {json_path}")
+
+    # Đọc file JSON
+    with open(json_path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    print(f"Successfully loaded JSON data with {len(document)} items")
+
+    # Tạo file DOCX
+    doc = Document()
+
+    # Thêm tiêu đề
+    doc.add_heading('Kết quả phân tích', 0)
+
+    # Thêm từng mục
+    for item in document:
+        # Thêm tiêu đề chính
+        doc.add_heading(item['title'], level=1)
+
+        # Thêm câu trả lời
+        if 'answer' in item:
+            p = doc.add_paragraph()
+            p.add_run('AI trả lời: ').bold = True
+            p.add_run(item['answer'])
+
+        # Thêm tài liệu tham khảo
+        if 'documents' in item:
+            doc.add_heading('Tài liệu tham khảo:', level=2)
+            for source, docs in item['documents'].items():
+                doc.add_heading(source, level=3)
+                for doc_item in docs:
+                    p = doc.add_paragraph()
+                    p.add_run(doc_item['title']).bold = True
+                    p.add_run('\n' + doc_item['text'])
+
+        # Xử lý sub_items nếu có
+        if 'sub_items' in item:
+            for sub_item in item['sub_items']:
+                # Thêm tiêu đề phụ
+                doc.add_heading(sub_item['title'], level=2)
+
+                # Thêm câu trả lời
+                if 'answer' in sub_item:
+                    p = doc.add_paragraph()
+                    p.add_run('AI trả lời: ').bold = True
+                    p.add_run(sub_item['answer'])
+
+                # Thêm tài liệu tham khảo
+                if 'documents' in sub_item:
+                    doc.add_heading('Tài liệu tham khảo:', level=3)
+                    for source, docs in sub_item['documents'].items():
+                        doc.add_heading(source, level=4)
+                        for doc_item in docs:
+                            p = doc.add_paragraph()
+                            p.add_run(doc_item['title']).bold = True
+                            p.add_run('\n' + doc_item['text'])
+
+                # Xử lý details nếu có
+                if 'details' in sub_item:
+                    for detail in sub_item['details']:
+                        # Thêm tiêu đề chi tiết
+                        doc.add_heading(detail['title'], level=3)
+
+                        # Thêm câu trả lời
+                        if 'answer' in detail:
+                            p = doc.add_paragraph()
+                            p.add_run('AI trả lời: ').bold = True
+                            p.add_run(detail['answer'])
+
+                        # Thêm tài liệu tham khảo
+                        if 'documents' in detail:
+                            doc.add_heading('Tài liệu tham khảo:', level=4)
+                            for source, docs in detail['documents'].items():
+                                doc.add_heading(source, level=5)
+                                for doc_item in docs:
+                                    p = doc.add_paragraph()
+                                    p.add_run(doc_item['title']).bold = True
+                                    p.add_run('\n' + doc_item['text'])
+
+                        # Xử lý sub_details nếu có
+                        if 'sub_details' in detail:
+                            for sub_detail in detail['sub_details']:
+                                # Thêm tiêu đề chi tiết phụ
+                                doc.add_heading(sub_detail['title'], level=4)
+
+                                # Thêm câu trả lời
+                                if 'answer' in sub_detail:
+                                    p = doc.add_paragraph()
+                                    p.add_run('AI trả lời: ').bold = True
+                                    p.add_run(sub_detail['answer'])
+
+                                # Thêm tài liệu tham khảo
+                                if 'documents' in sub_detail:
+                                    doc.add_heading('Tài liệu tham khảo:', level=5)
+                                    for source, docs in sub_detail['documents'].items():
+                                        doc.add_heading(source, level=6)
+                                        for doc_item in docs:
+                                            p = doc.add_paragraph()
+                                            p.add_run(doc_item['title']).bold = True
+                                            p.add_run('\n' + doc_item['text'])
+
+    # Tạo tên file DOCX
+    docx_filename = f"{os.path.splitext(filename)[0]}.docx"
+    docx_path = os.path.join(document_dir, docx_filename)
+
+    # Lưu file DOCX
+    doc.save(docx_path)
+    print(f"Successfully created DOCX file: {docx_path}")
+    return docx_path, docx_filename
+
 @app.post("/generate-docx")
 async def generate_docx(request: Request):
     try:
@@ -535,124 +825,8 @@ async def generate_docx(request: Request):
         if not filename:
             raise HTTPException(status_code=400, detail="Filename is required")
 
-        # Tìm file trong thư mục document
-        document_dir = "document"
-        matching_files = [f for f in os.listdir(document_dir) if f.endswith('.json') and filename in f]
-        
-        if not matching_files:
-            print(f"No matching files found for: {filename}")
-            raise HTTPException(status_code=404, detail="Document file not found")
-            
-        # Lấy file đầu tiên tìm thấy
-        document_file = matching_files[0]
-        json_path = os.path.join(document_dir, document_file)
-        print(f"Found matching file: {json_path}")
-
-        # Đọc file JSON
-        with open(json_path, 'r', encoding='utf-8') as f:
-            document = json.load(f)
-        print(f"Successfully loaded JSON data with {len(document)} items")
-
-        # Tạo file DOCX
-        doc = Document()
-        
-        # Thêm tiêu đề
-        doc.add_heading('Kết quả phân tích', 0)
-        
-        # Thêm từng mục
-        for item in document:
-            # Thêm tiêu đề chính
-            doc.add_heading(item['title'], level=1)
-            
-            # Thêm câu trả lời
-            if 'answer' in item:
-                p = doc.add_paragraph()
-                p.add_run('AI trả lời: ').bold = True
-                p.add_run(item['answer'])
-            
-            # Thêm tài liệu tham khảo
-            if 'documents' in item:
-                doc.add_heading('Tài liệu tham khảo:', level=2)
-                for source, docs in item['documents'].items():
-                    doc.add_heading(source, level=3)
-                    for doc_item in docs:
-                        p = doc.add_paragraph()
-                        p.add_run(doc_item['title']).bold = True
-                        p.add_run('\n' + doc_item['text'])
-            
-            # Xử lý sub_items nếu có
-            if 'sub_items' in item:
-                for sub_item in item['sub_items']:
-                    # Thêm tiêu đề phụ
-                    doc.add_heading(sub_item['title'], level=2)
-                    
-                    # Thêm câu trả lời
-                    if 'answer' in sub_item:
-                        p = doc.add_paragraph()
-                        p.add_run('AI trả lời: ').bold = True
-                        p.add_run(sub_item['answer'])
-                    
-                    # Thêm tài liệu tham khảo
-                    if 'documents' in sub_item:
-                        doc.add_heading('Tài liệu tham khảo:', level=3)
-                        for source, docs in sub_item['documents'].items():
-                            doc.add_heading(source, level=4)
-                            for doc_item in docs:
-                                p = doc.add_paragraph()
-                                p.add_run(doc_item['title']).bold = True
-                                p.add_run('\n' + doc_item['text'])
-                    
-                    # Xử lý details nếu có
-                    if 'details' in sub_item:
-                        for detail in sub_item['details']:
-                            # Thêm tiêu đề chi tiết
-                            doc.add_heading(detail['title'], level=3)
-                            
-                            # Thêm câu trả lời
-                            if 'answer' in detail:
-                                p = doc.add_paragraph()
-                                p.add_run('AI trả lời: ').bold = True
-                                p.add_run(detail['answer'])
-                            
-                            # Thêm tài liệu tham khảo
-                            if 'documents' in detail:
-                                doc.add_heading('Tài liệu tham khảo:', level=4)
-                                for source, docs in detail['documents'].items():
-                                    doc.add_heading(source, level=5)
-                                    for doc_item in docs:
-                                        p = doc.add_paragraph()
-                                        p.add_run(doc_item['title']).bold = True
-                                        p.add_run('\n' + doc_item['text'])
-                            
-                            # Xử lý sub_details nếu có
-                            if 'sub_details' in detail:
-                                for sub_detail in detail['sub_details']:
-                                    # Thêm tiêu đề chi tiết phụ
-                                    doc.add_heading(sub_detail['title'], level=4)
-                                    
-                                    # Thêm câu trả lời
-                                    if 'answer' in sub_detail:
-                                        p = doc.add_paragraph()
-                                        p.add_run('AI trả lời: ').bold = True
-                                        p.add_run(sub_detail['answer'])
-                                    
-                                    # Thêm tài liệu tham khảo
-                                    if 'documents' in sub_detail:
-                                        doc.add_heading('Tài liệu tham khảo:', level=5)
-                                        for source, docs in sub_detail['documents'].items():
-                                            doc.add_heading(source, level=6)
-                                            for doc_item in docs:
-                                                p = doc.add_paragraph()
-                                                p.add_run(doc_item['title']).bold = True
-                                                p.add_run('\n' + doc_item['text'])
-
-        # Tạo tên file DOCX
-        docx_filename = f"{os.path.splitext(filename)[0]}.docx"
-        docx_path = os.path.join(document_dir, docx_filename)
-        
-        # Lưu file DOCX
-        doc.save(docx_path)
-        print(f"Successfully created DOCX file: {docx_path}")
+        # Đọc JSON và dựng file DOCX trong luồng I/O
+        docx_path, docx_filename = await run_in_executor(io_executor, build_docx, filename)
 
         # Trả về file DOCX
         return FileResponse(
@@ -664,6 +838,23 @@ async def generate_docx(request: Request):
         print(f"Error generating DOCX: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating DOCX: {str(e)}")
 
+def list_files(dir_path):
+    if not os.path.exists(dir_path):
+        return []
+
+    files = []
+    for filename in os.listdir(dir_path):
+        file_path = os.path.join(dir_path, filename)
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            files.append({
+                "name": filename,
+                "path": file_path.replace("\\", "/"),
+                "size": stat.st_size,
+                "modified": stat.st_mtime
+            })
+    return files
+
 @app.get("/files")
 async def get_files(
     directory: Optional[str] = None,
@@ -681,20 +872,7 @@ async def get_files(
         else:
             dir_path = "temp"
 
-        if not os.path.exists(dir_path):
-            return {directory: []}
-
-        files = []
-        for filename in os.listdir(dir_path):
-            file_path = os.path.join(dir_path, filename)
-            if os.path.isfile(file_path):
-                stat = os.stat(file_path)
-                files.append({
-                    "name": filename,
-                    "path": file_path.replace("\\", "/"),
-                    "size": stat.st_size,
-                    "modified": stat.st_mtime
-                })
+        files = await run_in_executor(io_executor, list_files, dir_path)
 
         return {directory: files}
     except HTTPException as he:
@@ -721,7 +899,7 @@ async def delete_file(
         if not os.path.exists(path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        os.remove(path)
+        await run_in_executor(io_executor, os.remove, path)
         return {"message": "File deleted successfully"}
     except HTTPException as he:
         raise he
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from langchain.schema import Document
+from app import config
+from app.vector_store import index_namespace
+
+CITATION_PATTERN = re.compile(r'Điều\s+(\d+)', re.IGNORECASE)
+# Phần văn bản sau "Điều N" được dùng để đọc tên văn bản được trích dẫn
+CITATION_WINDOW = 200
+# Khoảng cách tối đa giữa hai "Điều" cùng nhóm trích dẫn (", ", " và ", ", khoản 2 "),
+# cũng là khoảng cách tối đa từ "Điều N" (sau từ nối) tới chỗ bắt đầu tên văn bản
+CITATION_GROUP_GAP = 20
+# Từ nối giữa "Điều N" và tên văn bản: "Điều 5 của Luật X", "quy định tại Điều 5 theo Luật X"
+CITATION_CONNECTIVE_PATTERN = re.compile(r'[\s,]*(?:(?:của|tại|theo|thuộc)\s+)?', re.IGNORECASE)
+
+
+def compact_name(text):
+    # "Luật Đất đai 2024" / "Luat_Dat_dai_2024.docx" -> "luatdatdai2024": bỏ dấu, chữ thường, chỉ giữ chữ và số
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in text.lower() if c.isascii() and c.isalnum())
+
+
+def program_keys(program):
+    # Tên văn bản (tên file bỏ đuôi) và tên bỏ năm/số hiệu ở cuối, để "Luật Đất đai" vẫn khớp "Luat_dat_dai_2024.docx"
+    name = compact_name(os.path.splitext(program)[0])
+    keys = {name, name.rstrip("0123456789")}
+    return [key for key in keys if len(key) >= 4]
+
+
+def is_heading(text, match):
+    # "Điều N" mở đầu câu hỏi, một dòng hay một đoạn " > " là số điều của chính hợp đồng đang đánh giá
+    # ("Điều 3: ... > 3.1 ..."), không phải trích dẫn
+    before = text[:match.start()].rstrip(" \t")
+    return not before or before.endswith((">", "\n"))
+
+
+class ArticleIndexWriter:
+    # Ghi chỉ mục điều luật của một văn bản trong lúc các chunk đi qua /learn: mỗi chunk được ghi ngay ra file
+    # tạm, chỉ giữ lại vị trí của nó trong file theo số điều. commit() thay file cũ và đưa vào chỉ mục.
+    def __init__(self, index, program):
+        self.index = index
+        self.program = program
+        self.path = index._path(program)
+        self.articles = {}
+        self._file = open(self.path + ".tmp", "wb")
+        self._file.write((json.dumps({"program": program}, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def add(self, chunk_id, text, metadata):
+        # Chunk không thuộc điều nào bị bỏ qua
+        if not metadata.get("article_number"):
+            return
+        self.articles.setdefault(metadata["article_number"], []).append(self._file.tell())
+        record = {"id": chunk_id, "text": text, "metadata": metadata}
+        self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+        self.index._set(self.program, self.articles)
+
+
+class ArticleIndex:
+    # Chỉ mục (văn bản, số điều) -> các chunk của điều đó, dựng lại cho từng văn bản mỗi lần /learn.
+    # Mỗi văn bản một file JSONL trong directory (dòng đầu là tên văn bản, mỗi dòng sau một chunk); trong RAM chỉ
+    # giữ vị trí các dòng theo (văn bản, số điều), nội dung chunk được đọc từ file khi tra cứu.
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._articles = {}
+        self._programs = {}
+        self._files = {}
+        self._keys = []
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, program):
+        return os.path.join(self.directory, hashlib.sha1(program.encode("utf-8")).hexdigest()[:12] + ".jsonl")
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith(".jsonl"):
+                continue
+            articles = {}
+            with open(os.path.join(self.directory, name), "rb") as f:
+                program = json.loads(f.readline())["program"]
+                offset = f.tell()
+                for line in iter(f.readline, b""):
+                    number = json.loads(line)["metadata"]["article_number"]
+                    articles.setdefault(number, []).append(offset)
+                    offset = f.tell()
+            self._set(program, articles)
+
+    def _set(self, program, articles):
+        # articles: số điều -> vị trí các chunk trong file của văn bản
+        handle = open(self._path(program), "rb")
+        with self._lock:
+            for number in self._programs.pop(program, ()):
+                self._articles.pop((program, number), None)
+            old = self._files.pop(program, None)
+            if old is not None:
+                old.close()
+            self._files[program] = handle
+            self._programs[program] = list(articles)
+            for number, offsets in articles.items():
+                self._articles[(program, number)] = offsets
+            self._refresh_keys()
+
+    def _refresh_keys(self):
+        # Khoá dài (cụ thể) thử trước để "luatdatdai2024" không bị "luatdatdai" của văn bản khác chiếm
+        self._keys = sorted(
+            ((key, program) for program in self._programs for key in program_keys(program)),
+            key=lambda item: -len(item[0])
+        )
+
+    def writer(self, program):
+        return ArticleIndexWriter(self, program)
+
+    def replace(self, program, chunks):
+        # chunks: (chunk_id, text, metadata) theo thứ tự trong văn bản
+        writer = self.writer(program)
+        for chunk_id, text, metadata in chunks:
+            writer.add(chunk_id, text, metadata)
+        writer.commit()
+
+    def get(self, program, article_number):
+        with self._lock:
+            offsets = self._articles.get((program, str(article_number)), ())
+            if not offsets:
+                return []
+            handle = self._files[program]
+            documents = []
+            for offset in offsets:
+                handle.seek(offset)
+                record = json.loads(handle.readline())
+                documents.append(Document(id=record["id"], page_content=record["text"], metadata=record["metadata"]))
+            return documents
+
+    def resolve_program(self, text):
+        # Văn bản đã học có tên đứng ngay sau "Điều N" (cách tối đa CITATION_GROUP_GAP ký tự sau từ nối),
+        # None nếu không có (ví dụ "Điều 5 của hợp đồng này ... theo Luật X" không phải trích dẫn Luật X)
+        text = text[CITATION_CONNECTIVE_PATTERN.match(text).end():]
+        window = compact_name(text[:CITATION_WINDOW])
+        limit = len(compact_name(text[:CITATION_GROUP_GAP]))
+        for key, program in self._keys:
+            position = window.find(key)
+            if 0 <= position <= limit:
+                return program
+        return None
+
+    def lookup(self, text, limit=None):
+        # Các chunk của những điều được trích dẫn rõ ràng ("Điều 12 Luật Đất đai", "Điều 3, Điều 4 của Luật X"),
+        # theo thứ tự trích dẫn, không trùng lặp. Quá limit chunk thì chia đều cho các điều (ưu tiên chunk đầu
+        # của mỗi điều) thay vì chỉ lấy điều đầu tiên.
+        matches = [match for match in CITATION_PATTERN.finditer(text) if not is_heading(text, match)]
+        if not matches or not self._keys:
+            return []
+        articles = []
+        pending = []
+        seen = set()
+        for i, match in enumerate(matches):
+            pending.append(match.group(1))
+            # Tên văn bản nằm giữa "Điều N" và trích dẫn kế tiếp; nhóm "Điều 3, Điều 4 của Luật X" dùng chung tên
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            gap = text[match.end():end]
+            program = self.resolve_program(gap)
+            if program is None:
+                if i + 1 == len(matches) or len(gap.strip()) > CITATION_GROUP_GAP:
+                    pending = []
+                continue
+            for number in pending:
+                if (program, number) in seen:
+                    continue
+                seen.add((program, number))
+                found = self.get(program, number)
+                if found:
+                    self.hits += 1
+                    articles.append(found)
+                else:
+                    self.misses += 1
+            pending = []
+        counts = [len(chunks) for chunks in articles]
+        if limit is not None and sum(counts) > limit:
+            counts = [0] * len(articles)
+            while sum(counts) < limit:
+                for i, chunks in enumerate(articles):
+                    if counts[i] < len(chunks) and sum(counts) < limit:
+                        counts[i] += 1
+        return [doc for chunks, count in zip(articles, counts) for doc in chunks[:count]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "programs": len(self._programs),
+                "articles": len(self._articles),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Mỗi chỉ mục vector có một chỉ mục điều luật riêng, chỉ mở một lần trong process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_article_index():
+    # None khi tắt ARTICLE_INDEX_ENABLED
+    if not config.ARTICLE_INDEX_ENABLED:
+        return None
+    directory = os.path.join(config.ARTICLE_INDEX_DIR, index_namespace())
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = ArticleIndex(directory)
+            _indexes[directory] = index
+        return index
@@ -0,0 +1,287 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from pydantic import ConfigDict
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from underthesea import word_tokenize
+from app import config
+from app.vector_store import index_namespace
+
+ARTICLE_REFERENCE_PATTERN = re.compile(r'Điều\s+(\d+)', re.IGNORECASE)
+
+
+def article_token(number):
+    # Token riêng cho "Điều N" để trích dẫn chính xác không bị loãng bởi mọi chunk có số N
+    return f"điều#{number}"
+
+
+# underthesea nạp model tách từ ở lần gọi đầu và bộ gán nhãn CRF không an toàn khi gọi đồng thời
+# từ nhiều luồng QA, nên mọi lần tách từ đi qua một khoá
+_tokenize_lock = threading.Lock()
+
+
+def tokenize(text):
+    # Tách từ tiếng Việt bằng underthesea ("quyền sử dụng" -> "quyền_sử_dụng"), chữ thường, bỏ dấu câu
+    with _tokenize_lock:
+        words = word_tokenize(text)
+    tokens = [word.lower().replace(" ", "_") for word in words if any(c.isalnum() for c in word)]
+    tokens.extend(article_token(number) for number in ARTICLE_REFERENCE_PATTERN.findall(text))
+    return tokens
+
+
+@lru_cache(maxsize=4096)
+def tokenize_query(text):
+    # Các điều khoản anh em / câu hỏi lặp lại nên nhớ kết quả tách từ của câu hỏi
+    return tuple(tokenize(text))
+
+
+def chunk_terms(text, metadata):
+    # Chỉ mục cả tên điều (chunk sau của một điều không chứa dòng tiêu đề) và số điều
+    tokens = tokenize(text)
+    title = metadata.get("article_title")
+    if title and not text.startswith(title):
+        tokens.extend(tokenize(title))
+    if metadata.get("article_number"):
+        tokens.append(article_token(metadata["article_number"]))
+    return Counter(tokens)
+
+
+class BM25Index:
+    # Chỉ mục đảo BM25 cục bộ trên nội dung chunk, cập nhật tăng dần cùng /learn:
+    # - postings.jsonl: mỗi chunk một bản ghi (id, text, metadata, tần suất từ); xoá ghi thành {"deleted": id}
+    # - trong RAM: từ -> danh sách (dòng, tần suất), mảng NumPy của từng từ dựng lại khi có dòng mới
+    def __init__(self, directory, k1=1.5, b=0.75):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._terms = []
+        self._lengths = []
+        self._row_by_id = {}
+        self._postings = {}
+        self._arrays = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._length_array = np.zeros(0, dtype=np.float32)
+        self._total_length = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, "postings.jsonl")
+
+    def __len__(self):
+        return len(self._row_by_id)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._row_by_id
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "deleted" in record:
+                    self._remove(record["deleted"])
+                else:
+                    self._append(record["id"], record["text"], record["metadata"], record["terms"])
+        self._refresh()
+
+    def _append(self, doc_id, text, metadata, terms):
+        self._remove(doc_id)
+        row = len(self._ids)
+        self._row_by_id[doc_id] = row
+        self._ids.append(doc_id)
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+        self._terms.append(terms)
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, []).append((row, tf))
+            self._arrays.pop(term, None)
+
+    def _remove(self, doc_id):
+        row = self._row_by_id.pop(doc_id, None)
+        if row is None:
+            return False
+        self._total_length -= self._lengths[row]
+        if row < len(self._alive):
+            self._alive[row] = False
+        return True
+
+    def _refresh(self):
+        alive = np.zeros(len(self._ids), dtype=bool)
+        alive[list(self._row_by_id.values())] = True
+        self._alive = alive
+        self._length_array = np.asarray(self._lengths, dtype=np.float32)
+
+    def add(self, ids, texts, metadatas):
+        # Upsert: bản cũ cùng id bị thay; tách từ ngoài khoá vì underthesea chậm hơn nhiều so với ghi chỉ mục
+        records = [
+            {"id": doc_id, "text": text, "metadata": metadata, "terms": chunk_terms(text, metadata)}
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        ]
+        if not records:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    self._append(record["id"], record["text"], record["metadata"], record["terms"])
+            self._refresh()
+
+    def delete(self, ids):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for doc_id in ids:
+                    if self._remove(doc_id):
+                        f.write(json.dumps({"deleted": doc_id}, ensure_ascii=False) + "\n")
+            dead = len(self._ids) - len(self._row_by_id)
+            if dead > 1000 and dead > 0.3 * len(self._ids):
+                self._compact()
+
+    def _compact(self):
+        # Ghi lại file chỉ với các chunk còn sống rồi dựng lại chỉ mục trong RAM
+        rows = sorted(self._row_by_id.values())
+        records = [(self._ids[row], self._texts[row], self._metadatas[row], self._terms[row]) for row in rows]
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            for doc_id, text, metadata, terms in records:
+                f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata, "terms": terms},
+                                   ensure_ascii=False) + "\n")
+        os.replace(self.path + ".tmp", self.path)
+        self._ids, self._texts, self._metadatas, self._terms, self._lengths = [], [], [], [], []
+        self._row_by_id, self._postings, self._arrays = {}, {}, {}
+        self._total_length = 0
+        for record in records:
+            self._append(*record)
+        self._refresh()
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term)
+            if not postings:
+                return None
+            rows, tfs = zip(*postings)
+            arrays = (np.asarray(rows, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def search_with_score(self, query, k=4):
+        terms = Counter(tokenize_query(query))
+        with self._lock:
+            count = len(self._row_by_id)
+            if not count or not terms:
+                return []
+            average_length = max(self._total_length / count, 1.0)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            for term, query_tf in terms.items():
+                arrays = self._term_arrays(term)
+                if arrays is None:
+                    continue
+                rows, tfs = arrays
+                # Số chunk còn sống chứa từ (dòng đã xoá vẫn nằm trong postings cho tới lần compact)
+                df = int(self._alive[rows].sum())
+                if not df:
+                    continue
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self._length_array[rows] / average_length)
+                scores[rows] += query_tf * idf * tfs * (self.k1 + 1) / (tfs + norm)
+            scores[~self._alive] = 0
+            k = min(k, int(np.count_nonzero(scores)))
+            if k <= 0:
+                return []
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(-scores[top])]
+            return [(self._document(row), float(scores[row])) for row in top]
+
+    def search(self, query, k=4):
+        return [doc for doc, _ in self.search_with_score(query, k)]
+
+    def _document(self, row):
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def stats(self):
+        with self._lock:
+            return {"chunks": len(self._row_by_id), "terms": len(self._postings)}
+
+
+def chunk_key(document):
+    return document.metadata.get("chunk_id") or document.id or document.page_content
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=60):
+    # Gộp các danh sách đã xếp hạng: điểm = tổng 1 / (rrf_k + thứ hạng), chunk trùng chỉ giữ một
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    # Truy xuất kết hợp: fetch_k chunk gần nhất theo vector + fetch_k chunk BM25, gộp bằng RRF, giữ k chunk
+    vectorstore: VectorStore
+    index: BM25Index
+    search_kwargs: dict = {"k": 5}
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def dense_k(self):
+        return max(self.fetch_k, self.search_kwargs.get("k", 5))
+
+    def search(self, query, vector=None):
+        if vector is None:
+            dense = self.vectorstore.similarity_search(query, k=self.dense_k)
+        else:
+            dense = self.vectorstore.similarity_search_by_vector(vector, k=self.dense_k)
+        return self.fuse(query, dense)
+
+    def fuse(self, query, dense):
+        # Gộp dense_k kết quả theo vector (tìm trên vector store hoặc chọn từ tập ứng viên có sẵn) với BM25
+        keyword = self.index.search(query, k=self.dense_k)
+        return reciprocal_rank_fusion([dense, keyword], self.search_kwargs.get("k", 5), self.rrf_k)
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        return self.search(query)
+
+
+# Mỗi chỉ mục vector có một chỉ mục BM25 riêng, chỉ mở một lần trong process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index():
+    # None khi tắt HYBRID_SEARCH_ENABLED
+    if not config.HYBRID_SEARCH_ENABLED:
+        return None
+    directory = os.path.join(config.BM25_INDEX_DIR, index_namespace())
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = BM25Index(directory, k1=config.BM25_K1, b=config.BM25_B)
+            _indexes[directory] = index
+        return index
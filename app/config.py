@@ -3,8 +3,135 @@ from dotenv import load_dotenv
 
 load_dotenv()
 EMBEDDING_MODEL = "bkai-foundation-models/vietnamese-bi-encoder"
+# Backend embedding: "torch" (fp32) hoặc "onnx-int8" (xuất ONNX + lượng tử hoá động int8, lưu trong ONNX_MODEL_DIR)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/onnx")
+# Cấu hình lượng tử hoá của optimum: "avx512_vnni", "avx512", "avx2" hoặc "arm64"
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx512_vnni")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = "test"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 CHUNK_SIZE = 500
-CHUNK_OVERLAP = 200
\ No newline at end of file
+CHUNK_OVERLAP = 200
+# Cách đo độ dài chunk: "chars" (CHUNK_SIZE/CHUNK_OVERLAP ký tự) hoặc "tokens" (tokenizer của EMBEDDING_MODEL;
+# CHUNK_TOKEN_SIZE = 0 nghĩa là lấp đầy cửa sổ của model). Đổi cách đo thì /learn sẽ thay toàn bộ chunk cũ.
+CHUNK_SIZING = os.getenv("CHUNK_SIZING", "chars")
+CHUNK_TOKEN_SIZE = int(os.getenv("CHUNK_TOKEN_SIZE", "0"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "32"))
+# Số mục (điều khoản lá) được đánh giá đồng thời trong process_json
+QA_MAX_WORKERS = int(os.getenv("QA_MAX_WORKERS", "4"))
+
+# Giới hạn gọi LLM (dùng chung cho mọi job): số request/phút, retry và backoff khi hết quota
+LLM_RPM = int(os.getenv("LLM_RPM", "15"))
+LLM_BURST = int(os.getenv("LLM_BURST", "1"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "2"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+# Hàng đợi job /process: số job chạy đồng thời và thời gian giữ job đã xong (giây)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+# Executor cho các endpoint: luồng cho I/O chặn, process cho phần parse nặng CPU
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+
+# Model LLM dùng để đánh giá điều khoản
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+
+# Cache câu trả lời trên đĩa (SQLite): thời gian sống (giây) và số bản ghi tối đa
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "cache/answers.sqlite3")
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(30 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "100000"))
+
+# Semantic cache (tuỳ chọn): dùng lại câu trả lời của câu hỏi gần giống nếu cosine >= ngưỡng
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "cache/semantic")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "50000"))
+
+# Số chunk truy xuất cho mỗi câu hỏi
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "5"))
+
+# Gộp các điều khoản anh em (cùng mục cha) vào một lượt gọi LLM, tối đa BATCH_MAX_CLAUSES điều khoản/lượt
+BATCH_CLAUSES = os.getenv("BATCH_CLAUSES", "false").lower() == "true"
+BATCH_MAX_CLAUSES = int(os.getenv("BATCH_MAX_CLAUSES", "8"))
+
+# Kích thước lô khi embed (câu hỏi và chunk)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Backend vector store: "pinecone" hoặc "local" (chỉ mục NumPy memory-mapped trong LOCAL_INDEX_DIR)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+EMBEDDING_DIM = 768
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "vector_index")
+# "exact" (cosine trên toàn bộ ma trận) hoặc "ivf" (xấp xỉ: chỉ thăm IVF_NPROBE trong IVF_NLIST cụm)
+LOCAL_INDEX_SEARCH = os.getenv("LOCAL_INDEX_SEARCH", "exact")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "256"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+
+# Manifest theo từng văn bản: các chunk đã được đưa vào chỉ mục (để /learn chỉ cập nhật phần thay đổi)
+INDEX_MANIFEST_DIR = os.getenv("INDEX_MANIFEST_DIR", "index_manifest")
+
+# Pipeline /learn: số lô tối đa chờ giữa các bước chunk -> embed -> upsert (giới hạn bộ nhớ)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+# Embed khi /learn bằng nhiều process (mỗi process nạp model một lần); 0 hoặc 1 = embed ngay trong process hiện tại
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "0"))
+# Số luồng torch trong mỗi process embed
+INGEST_EMBED_THREADS = int(os.getenv("INGEST_EMBED_THREADS", "1"))
+
+# Cache embedding theo model + nội dung chunk/câu hỏi (float16, memory-mapped), bỏ bản ít dùng nhất khi đầy
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "cache/embeddings")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Đọc text PDF song song trên CPU_WORKERS process khi phạm vi có từ PDF_PARALLEL_MIN_PAGES trang trở lên,
+# mỗi lần gửi PDF_PAGES_PER_TASK trang
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+
+# Cache text đã trích xuất theo hash nội dung file (SQLite), dùng chung cho /learn và /process
+EXTRACT_CACHE_ENABLED = os.getenv("EXTRACT_CACHE_ENABLED", "true").lower() == "true"
+EXTRACT_CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH", "cache/extracted.sqlite3")
+EXTRACT_CACHE_MAX_FILES = int(os.getenv("EXTRACT_CACHE_MAX_FILES", "200"))
+
+# Truy xuất kết hợp: BM25 cục bộ (tách từ bằng underthesea, cập nhật cùng /learn) + vector, gộp bằng
+# reciprocal rank fusion. Mỗi bên lấy HYBRID_FETCH_K chunk rồi giữ RETRIEVER_K chunk sau khi gộp.
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", "bm25_index")
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Chỉ mục (văn bản, số điều) -> chunk, dựng khi /learn: điều luật được trích dẫn rõ ràng trong câu hỏi
+# ("theo Điều 12 Luật Đất đai") lấy thẳng từ chỉ mục, chỉ tìm tương đồng cho số chunk còn lại
+ARTICLE_INDEX_ENABLED = os.getenv("ARTICLE_INDEX_ENABLED", "true").lower() == "true"
+ARTICLE_INDEX_DIR = os.getenv("ARTICLE_INDEX_DIR", "article_index")
+
+# Xếp hạng lại bằng cross-encoder (tuỳ chọn): truy xuất RERANK_CANDIDATES chunk rồi chỉ gửi RERANK_TOP_N chunk
+# có điểm cao nhất cho LLM. Điểm được cache theo (câu hỏi, chunk) trong RAM.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+
+# Dựng ngữ cảnh cho prompt: ghép các chunk gối nhau của cùng một điều, bỏ đoạn trùng/gần trùng
+# (tỉ lệ 3-gram từ trùng >= CONTEXT_NEAR_DUPLICATE) và cắt vừa CONTEXT_TOKEN_BUDGET token cho mỗi điều khoản
+CONTEXT_BUILDER_ENABLED = os.getenv("CONTEXT_BUILDER_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_NEAR_DUPLICATE = float(os.getenv("CONTEXT_NEAR_DUPLICATE", "0.9"))
+# Số ký tự gối tối thiểu để coi hai chunk của cùng một điều là liền nhau
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", "20"))
+TIKTOKEN_ENCODING = os.getenv("TIKTOKEN_ENCODING", "cl100k_base")
+
+# Truy xuất theo nhóm khi /process: mỗi nhóm mục lá truy vấn vector store một lần lấy
+# RETRIEVAL_POOL_SIZE ứng viên chung, từng mục lá chọn lại trong đó bằng vector câu hỏi đã tính sẵn
+RETRIEVAL_POOL_ENABLED = os.getenv("RETRIEVAL_POOL_ENABLED", "true").lower() == "true"
+RETRIEVAL_POOL_SIZE = int(os.getenv("RETRIEVAL_POOL_SIZE", "60"))
+# "term": một tập ứng viên cho cả Điều; "sub_item": riêng cho từng mục 1.1 có mục con a), i), ...
+RETRIEVAL_POOL_LEVEL = os.getenv("RETRIEVAL_POOL_LEVEL", "term")
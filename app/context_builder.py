@@ -0,0 +1,159 @@
+import re
+import threading
+import tiktoken
+from langchain.schema import Document
+from app.config import (
+    CONTEXT_BUILDER_ENABLED, CONTEXT_TOKEN_BUDGET, CONTEXT_NEAR_DUPLICATE, CONTEXT_MIN_OVERLAP, TIKTOKEN_ENCODING
+)
+
+WORD_PATTERN = re.compile(r"\w+")
+# Phần còn lại của ngân sách nhỏ hơn ngần này token thì không cắt thêm một đoạn vào nữa
+MIN_TRUNCATED_TOKENS = 32
+
+
+def overlap_length(first, second, min_overlap):
+    # Độ dài phần đuôi của first trùng với phần đầu của second (chunk liền nhau do CHUNK_OVERLAP), 0 nếu không gối
+    head = second[:min_overlap]
+    start = first.find(head, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(head, start + 1)
+    return 0
+
+
+def merge_segments(segments, min_overlap):
+    # segments: [thứ hạng, text] của cùng một điều; ghép các cặp gối nhau thành đoạn liền mạch và bỏ đoạn nằm
+    # trọn trong đoạn khác. Đoạn ghép lấy thứ hạng tốt nhất của các chunk thành phần.
+    segments = [list(segment) for segment in segments]
+    changed = True
+    while changed and len(segments) > 1:
+        changed = False
+        for a in segments:
+            for b in segments:
+                if a is b or a[1] is None or b[1] is None:
+                    continue
+                if b[1] in a[1]:
+                    length = len(b[1])
+                else:
+                    length = overlap_length(a[1], b[1], min_overlap)
+                    if not length:
+                        continue
+                a[0] = min(a[0], b[0])
+                a[1] = a[1] + b[1][length:]
+                b[1] = None
+                changed = True
+        segments = [segment for segment in segments if segment[1] is not None]
+    return segments
+
+
+def shingles(text, size=3):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextBuilder:
+    # Dựng ngữ cảnh cho prompt từ các chunk đã truy xuất: ghép các chunk gối nhau của cùng một điều thành đoạn
+    # liền mạch, bỏ đoạn trùng/gần trùng (tỉ lệ 3-gram từ nằm trong đoạn đã giữ >= near_duplicate), rồi cắt vừa
+    # ngân sách token (đếm bằng tiktoken). Ghi lại số token tiết kiệm được của từng lượt.
+    def __init__(self, budget, near_duplicate=0.9, min_overlap=20, encoding=TIKTOKEN_ENCODING):
+        self.budget = budget
+        self.near_duplicate = near_duplicate
+        self.min_overlap = min_overlap
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+        try:
+            self._encoding = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            # Không tải được bảng mã (máy không có mạng): ước lượng 4 ký tự / token
+            print(f"⚠️ Không nạp được tiktoken encoding {encoding}, ước lượng số token theo độ dài: {str(e)}")
+            self._encoding = None
+
+    @property
+    def version(self):
+        # Các thiết lập quyết định ngữ cảnh đưa vào prompt (cùng chunk khác thiết lập thì khác ngữ cảnh)
+        encoding = self._encoding.name if self._encoding is not None else "chars/4"
+        return f"{self.budget}:{self.near_duplicate}:{self.min_overlap}:{encoding}"
+
+    def count_tokens(self, text):
+        if self._encoding is None:
+            return (len(text) + 3) // 4
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, tokens):
+        if self._encoding is None:
+            return text[:tokens * 4]
+        return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:tokens]).rstrip("�")
+
+    def build(self, documents, budget=None):
+        # Trả về (documents cho prompt, thống kê token); documents gốc vẫn dùng làm nguồn tham chiếu và khoá cache
+        budget = budget or self.budget
+        tokens_in = sum(self.count_tokens(doc.page_content) for doc in documents)
+
+        groups = {}
+        for rank, doc in enumerate(documents):
+            metadata = doc.metadata
+            key = (metadata.get("program"), metadata.get("chapter_title"), metadata.get("article_title")) \
+                if metadata.get("article_title") else rank
+            groups.setdefault(key, []).append((rank, doc.page_content))
+        segments = sorted(
+            (segment for items in groups.values() for segment in merge_segments(items, self.min_overlap)),
+            key=lambda segment: segment[0]
+        )
+
+        kept = []
+        for rank, text in segments:
+            words = shingles(text)
+            if any(len(words & seen) >= self.near_duplicate * len(words) for _, _, seen in kept):
+                continue
+            kept.append((rank, text, words))
+
+        context = []
+        tokens_out = 0
+        for rank, text, _ in kept:
+            tokens = self.count_tokens(text)
+            if tokens_out + tokens > budget:
+                remaining = budget - tokens_out
+                if remaining >= MIN_TRUNCATED_TOKENS:
+                    text = self.truncate(text, remaining)
+                    tokens = self.count_tokens(text)
+                    context.append(Document(page_content=text, metadata=dict(documents[rank].metadata)))
+                    tokens_out += tokens
+                break
+            context.append(Document(page_content=text, metadata=dict(documents[rank].metadata)))
+            tokens_out += tokens
+
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+        stats = {
+            "documents_in": len(documents),
+            "documents_out": len(context),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": tokens_in - tokens_out,
+        }
+        if stats["tokens_saved"]:
+            print(f"🧮 Ngữ cảnh: {len(documents)} chunk {tokens_in} token -> {len(context)} đoạn {tokens_out} token "
+                  f"(tiết kiệm {stats['tokens_saved']} token)")
+        return context, stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "saved_ratio": 1 - self.tokens_out / self.tokens_in if self.tokens_in else 0.0,
+            }
+
+
+context_builder = ContextBuilder(
+    CONTEXT_TOKEN_BUDGET, CONTEXT_NEAR_DUPLICATE, CONTEXT_MIN_OVERLAP, TIKTOKEN_ENCODING
+) if CONTEXT_BUILDER_ENABLED else None
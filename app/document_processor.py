@@ -1,413 +1,421 @@
 import os
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import Docx2txtLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from pinecone import Pinecone, ServerlessSpec
 from langchain.schema import Document
 from app.config import *
-import fitz  # PyMuPDF
+from app.vector_store import get_vectorstore, upsert_embeddings, index_namespace, delete_by_program
+from app.ingestion import run_ingestion
+from app.bm25_index import get_bm25_index
+from app.article_index import get_article_index
+from app.loaders import iter_pages, DOCX_TEXT
+from app.embedding_pool import ParallelEmbeddings
+from app.embedding_backend import create_embeddings
+from app.embedding_cache import CachedEmbeddings, create_embedding_cache, embedding_namespace
 import re
 import json
+import hashlib
+import time
+from functools import lru_cache
+
+# Backend theo EMBEDDING_BACKEND: "torch" (fp32) hoặc "onnx-int8"
+base_embeddings = create_embeddings(EMBEDDING_BACKEND)
+
+# Cả /learn lẫn câu hỏi đều đi qua cache embedding (nếu bật) để không embed lại văn bản đã gặp
+embedding_cache = create_embedding_cache(EMBEDDING_DIM, embedding_namespace())
+embeddings = CachedEmbeddings(base_embeddings, embedding_cache, embedding_namespace()) if embedding_cache else base_embeddings
+
+def token_length_function(tokenizer):
+    # Bộ tách gọi hàm độ dài lặp lại trên cùng các đoạn nhỏ nên nhớ lại kết quả
+    @lru_cache(maxsize=65536)
+    def token_length(text):
+        return len(tokenizer.tokenize(text))
+    return token_length
+
+def create_text_splitter(sizing=CHUNK_SIZING, chunk_size=None, chunk_overlap=None):
+    # "chars": CHUNK_SIZE/CHUNK_OVERLAP ký tự như trước. "tokens": đếm bằng tokenizer của bi-encoder, mặc định
+    # lấp đầy cửa sổ của model (max_seq_length trừ 2 token đặc biệt) và chỉ gối CHUNK_TOKEN_OVERLAP token
+    if sizing == "tokens":
+        model = base_embeddings.client
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size or CHUNK_TOKEN_SIZE or (model.max_seq_length or 256) - 2,
+            chunk_overlap=CHUNK_TOKEN_OVERLAP if chunk_overlap is None else chunk_overlap,
+            length_function=token_length_function(model.tokenizer),
+        )
+    if sizing != "chars":
+        raise ValueError(f"Unsupported CHUNK_SIZING: {sizing}")
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap,
+        length_function=len,
+    )
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=CHUNK_SIZE,
-    chunk_overlap=CHUNK_OVERLAP,
-    length_function=len,
-)
-
-embeddings = HuggingFaceEmbeddings(
-    model_name=EMBEDDING_MODEL,
-    model_kwargs={'device': 'cpu'},
-    encode_kwargs={'normalize_embeddings': True}
-)
-def chunk_articles_with_metadata(text, document_name="Văn bản pháp luật"):
-    def split_into_chapters(text):
-        # Nếu không có chương, trả về một chương giả
-        if not re.search(r'Chương\s+[IVXLCDM]+\.', text):
-            return [("Không có chương", text.strip())]
-
-        # Tách theo chương
-        chapters = re.split(r'(Chương\s+[IVXLCDM]+\.\s+.+)', text)
-        result = []
-        for i in range(1, len(chapters), 2):
-            chapter_title = chapters[i].strip()
-            chapter_content = chapters[i + 1].strip()
-            result.append((chapter_title, chapter_content))
-        return result
-
-    def split_into_articles(chapter_content):
-        # Tách theo điều
-        articles = re.split(r'(Điều\s+\d+\.\s+.+)', chapter_content)
-        result = []
-        for i in range(1, len(articles), 2):
-            article_title = articles[i].strip()
-            article_content = articles[i + 1].strip()
-            full_article = article_title + "\n" + article_content
-            result.append((article_title, full_article))
-        return result
-
-    chunks_with_metadata = []
-    chapters = split_into_chapters(text)
-
-    for chapter_title, chapter_content in chapters:
-        articles = split_into_articles(chapter_content)
-        for article_title, full_article in articles:
-            chunks = text_splitter.split_text(full_article)
-            for chunk in chunks:
-                chunks_with_metadata.append({
-                    "text": chunk,
-                    "metadata": {
-                        "program": document_name,
-                        "chapter_title": chapter_title,
-                        "article_title": article_title,
-                        "article_number": re.search(r'Điều\s+(\d+)', article_title).group(1) if re.search(r'Điều\s+(\d+)', article_title) else None
-                    }
-                })
-
-    return chunks_with_metadata
+text_splitter = create_text_splitter()
+
+# Pool process embed cho /learn, chỉ tạo khi INGEST_EMBED_WORKERS > 1
+_ingest_embeddings = None
+
+def get_ingest_embeddings():
+    global _ingest_embeddings
+    if INGEST_EMBED_WORKERS <= 1:
+        return embeddings
+    if _ingest_embeddings is None:
+        pool = ParallelEmbeddings(
+            EMBEDDING_MODEL,
+            INGEST_EMBED_WORKERS,
+            backend=EMBEDDING_BACKEND,
+            threads=INGEST_EMBED_THREADS,
+            encode_kwargs=base_embeddings.encode_kwargs
+        )
+        _ingest_embeddings = CachedEmbeddings(pool, embedding_cache, embedding_namespace()) if embedding_cache else pool
+    return _ingest_embeddings
+
+def close_ingest_embeddings():
+    global _ingest_embeddings
+    if _ingest_embeddings is not None:
+        pool = _ingest_embeddings.embeddings if embedding_cache else _ingest_embeddings
+        pool.close()
+        _ingest_embeddings = None
+    if embedding_cache:
+        embedding_cache.flush()
+
+CHAPTER_HEADING_PATTERN = re.compile(r'(Chương\s+[IVXLCDM]+\.\s+.+)')
+ARTICLE_HEADING_PATTERN = re.compile(r'(Điều\s+\d+\.\s+.+)')
+ARTICLE_NUMBER_PATTERN = re.compile(r'Điều\s+(\d+)')
+# Dòng kết thúc bằng phần đầu của tiêu đề ("Chương", "Chương II.", "Điều", "Điều 5."): \s+ trong hai pattern trên
+# có thể vượt qua dấu xuống dòng, nên dòng này được ghép với dòng sau rồi mới tách
+PARTIAL_HEADING_PATTERN = re.compile(r'(?:Chương(?:\s+[IVXLCDM]+\.)?|Điều(?:\s+\d+\.)?)\s*$')
+NO_CHAPTER_TITLE = "Không có chương"
+
+def iter_text_lines(text):
+    # Tách theo "\n" (giữ ký tự xuống dòng) mà không dựng list mọi dòng
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end + 1]
+        start = end + 1
+
+def iter_heading_lines(lines):
+    pending = []
+    for line in lines:
+        pending.append(line)
+        if PARTIAL_HEADING_PATTERN.search(line) or (len(pending) > 1 and not line.strip()):
+            continue
+        yield "".join(pending)
+        pending = []
+    if pending:
+        yield "".join(pending)
+
+def iter_article_chunks(lines, document_name="Văn bản pháp luật", splitter=None):
+    # Đọc văn bản theo từng dòng (chuỗi hoặc iterator các dòng giữ "\n"), chỉ giữ nội dung của điều đang đọc;
+    # mỗi khi gặp tiêu đề chương/điều mới thì tách điều trước thành các chunk nhỏ.
+    # Nội dung trước điều đầu tiên của mỗi chương bị bỏ; điều nằm trước chương đầu tiên thuộc "Không có chương".
+    if isinstance(lines, str):
+        lines = iter_text_lines(lines)
+    splitter = splitter or text_splitter
+    chapter_title = NO_CHAPTER_TITLE
+    article_title = None
+    content = []
+
+    for line in iter_heading_lines(lines):
+        for chapter_index, chapter_piece in enumerate(CHAPTER_HEADING_PATTERN.split(line)):
+            if chapter_index % 2 == 1:
+                yield from split_article(splitter, document_name, chapter_title, article_title, content)
+                chapter_title = chapter_piece.strip()
+                article_title = None
+                content = []
+                continue
+            for article_index, piece in enumerate(ARTICLE_HEADING_PATTERN.split(chapter_piece)):
+                if article_index % 2 == 1:
+                    yield from split_article(splitter, document_name, chapter_title, article_title, content)
+                    article_title = piece.strip()
+                    content = []
+                elif article_title is not None:
+                    content.append(piece)
+
+    yield from split_article(splitter, document_name, chapter_title, article_title, content)
+
+def split_article(splitter, document_name, chapter_title, article_title, content):
+    if article_title is None:
+        return
+    full_article = article_title + "\n" + "".join(content).strip()
+    # Metadata tính một lần cho cả điều, mỗi chunk nhận một bản sao
+    article_number = ARTICLE_NUMBER_PATTERN.search(article_title)
+    metadata = {
+        "program": document_name,
+        "chapter_title": chapter_title,
+        "article_title": article_title,
+        "article_number": article_number.group(1) if article_number else None
+    }
+    for chunk in splitter.split_text(full_article):
+        yield {"text": chunk, "metadata": dict(metadata)}
+
+def chunk_articles_with_metadata(text, document_name="Văn bản pháp luật", splitter=None):
+    return list(iter_article_chunks(text, document_name=document_name, splitter=splitter))
     
 def setup_pinecone_index():
     pc = Pinecone(api_key=PINECONE_API_KEY)
     if PINECONE_INDEX_NAME not in pc.list_indexes().names():
         pc.create_index(
             name=PINECONE_INDEX_NAME,
-            dimension=768,
+            dimension=EMBEDDING_DIM,
             metric='cosine',
             spec=ServerlessSpec(cloud='aws', region='us-east-1')
         )
     return pc
 
+def make_chunk_id(document_name, article_number, text):
+    # ID ổn định: cùng văn bản + cùng điều + cùng nội dung luôn cho cùng một ID (chỉ gồm ký tự ASCII cho Pinecone)
+    document_hash = hashlib.sha1(document_name.encode("utf-8")).hexdigest()[:12]
+    content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return f"{document_hash}-{article_number or 0}-{content_hash}"
+
+def manifest_path(document_name):
+    # Manifest tách theo backend/chỉ mục để đổi VECTOR_BACKEND không làm sai lệch trạng thái
+    document_hash = hashlib.sha1(document_name.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(INDEX_MANIFEST_DIR, index_namespace(), f"{document_hash}.json")
+
+def load_manifest(document_name):
+    path = manifest_path(document_name)
+    if not os.path.exists(path):
+        return {"document": document_name, "chunks": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    path = manifest_path(manifest["document"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def iter_learn_lines(file_path):
+    # Các trang PDF (hoặc toàn văn DOCX qua docx2txt) nối với nhau bằng "\n", tách dòng dần cho bộ chunk
+    for index, text in enumerate(iter_pages(file_path, docx_unit=DOCX_TEXT)):
+        if index:
+            yield "\n"
+        yield from iter_text_lines(text)
+
 def process_document(file_path):
     print(f"📄 Đang xử lý file: {file_path}")
-
-    # Load nội dung file
-    loader = Docx2txtLoader(file_path)
-    documents = loader.load()
-
-    # Ghép lại nội dung thành chuỗi lớn
-    full_text = "\n".join([doc.page_content for doc in documents])
-
-    # Tách chương > điều > chunk nhỏ
-    splits = []
-    chapter_article_chunks = chunk_articles_with_metadata(full_text, document_name=os.path.basename(file_path))
-
-    for chunk in chapter_article_chunks:
-        splits.append(Document(
-            page_content=chunk["text"],
-            metadata=chunk["metadata"]
-        ))
-
-    # Đưa vào Pinecone
-    vectorstore = PineconeVectorStore.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        index_name=PINECONE_INDEX_NAME,
-        pinecone_api_key=PINECONE_API_KEY
-    )
-
-    print(f"✅ Đã lưu {len(splits)} chunks vào Pinecone")
-    return vectorstore
-
-
-import re
-import fitz  # PyMuPDF
-# import docx
-
-def extract_structured_terms(file_path, start_page, end_page):
-    try:
-        # Mở file dựa theo định dạng
-        if file_path.lower().endswith('.pdf'):
-            doc = fitz.open(file_path)
-            if not doc:
-                raise ValueError("Could not open PDF file")
-            total_pages = len(doc)
-            print(f"Total pages in PDF: {total_pages}")
-        elif file_path.lower().endswith('.docx'):
-            doc = Document(file_path)
-            total_pages = len(doc.paragraphs)
-            print(f"Total paragraphs in DOCX: {total_pages}")
-        else:
-            raise ValueError("Unsupported file format. Only PDF and DOCX files are supported.")
-
-        # Kiểm tra phạm vi trang/đoạn văn
-        if start_page < 1 or start_page > total_pages:
-            raise ValueError(f"Start page {start_page} is out of range (1-{total_pages})")
-        if end_page < start_page or end_page > total_pages:
-            raise ValueError(f"End page {end_page} is out of range ({start_page}-{total_pages})")
-
-        text = ""
-
-        # Trích xuất text từ PDF
-        if file_path.lower().endswith('.pdf'):
-            for i in range(start_page - 1, end_page):
-                try:
-                    page = doc[i]
-                    if page:
-                        page_text = page.get_text()
-                        if page_text:
-                            text += page_text + "\n"
-                            print(f"Successfully extracted text from page {i+1}")
-                        else:
-                            print(f"Warning: No text found on page {i+1}")
-                    else:
-                        print(f"Warning: Could not access page {i+1}")
-                except Exception as e:
-                    print(f"Error processing page {i+1}: {str(e)}")
-        # Trích xuất text từ DOCX
-        else:
-            for i in range(start_page - 1, end_page):
-                try:
-                    para_text = doc.paragraphs[i].text
-                    if para_text:
-                        text += para_text + "\n"
-                        print(f"Successfully extracted text from paragraph {i+1}")
-                    else:
-                        print(f"Warning: No text found in paragraph {i+1}")
-                except Exception as e:
-                    print(f"Error processing paragraph {i+1}: {str(e)}")
-
-        if not text.strip():
-            raise ValueError("No text content found in the specified page range")
-
-        print(f"Extracted text length: {len(text)} characters")
-        lines = text.splitlines()
-        print(f"Number of lines: {len(lines)}")
-
-        result = []
-        current_term = None
-        current_sub = None
-        current_detail = None
-
-        for line in lines:
-            line = line.strip()
-            if not line:
+    document_name = os.path.basename(file_path)
+
+    manifest = load_manifest(document_name)
+    indexed = manifest["chunks"]
+    # Manifest mới chỉ giữ id + số/tên điều của mỗi chunk, không giữ nội dung hay vector
+    current = {}
+    # Chunk đã có trong chỉ mục vector nhưng chưa có trong BM25 (học trước khi bật truy xuất kết hợp)
+    bm25_index = get_bm25_index()
+    backfill = []
+    # Chỉ mục (văn bản, số điều) của văn bản này được ghi lại từ đầu, từng chunk một khi chunk đi qua
+    article_index = get_article_index()
+    article_writer = article_index.writer(document_name) if article_index is not None else None
+
+    def new_chunks():
+        # Tách chương > điều > chunk nhỏ, mỗi chunk có ID ổn định (chunk trùng nội dung trong cùng điều chỉ giữ một);
+        # chỉ chunk mới hoặc đã đổi so với manifest mới được đưa sang bước embed/upsert
+        for chunk in iter_article_chunks(iter_learn_lines(file_path), document_name=document_name):
+            metadata = chunk["metadata"]
+            chunk_id = make_chunk_id(document_name, metadata["article_number"], chunk["text"])
+            if chunk_id in current:
                 continue
-
-            # Điều khoản chính: "Điều 1:", "Điều 2."
-            if re.match(r"^Điều\s+\d+[\.:]", line):
-                # Kết thúc khối cũ
-                if current_term:
-                    if current_sub:
-                        if current_detail:
-                            current_sub["details"].append(current_detail)
-                            current_detail = None
-                        current_term["sub_items"].append(current_sub)
-                        current_sub = None
-                    result.append(current_term)
-                current_term = {"title": line, "sub_items": []}
-                current_sub = None
-                current_detail = None
-
-            # Mục 1.1, 2.3,...
-            elif re.match(r"^\d+\.\d+", line):
-                if current_term is None:
-                    # Khởi tạo current_term mặc định nếu chưa có
-                    current_term = {"title": "Không rõ tiêu đề", "sub_items": []}
-
+            current[chunk_id] = {
+                "article_number": metadata["article_number"],
+                "article_title": metadata["article_title"],
+            }
+            if article_writer is not None:
+                article_writer.add(chunk_id, chunk["text"], {**metadata, "chunk_id": chunk_id})
+            if chunk_id in indexed:
+                if bm25_index is not None and chunk_id not in bm25_index:
+                    backfill.append((chunk_id, chunk["text"], {**metadata, "chunk_id": chunk_id}))
+                continue
+            yield chunk_id, Document(page_content=chunk["text"], metadata={**metadata, "chunk_id": chunk_id})
+
+    # Đưa vào vector store (Pinecone hoặc chỉ mục cục bộ, theo VECTOR_BACKEND) theo từng lô:
+    # embed lô sau trong lúc upsert lô trước
+    vectorstore = get_vectorstore(embeddings)
+    # Chưa có manifest: văn bản có thể đã được học bằng from_documents với ID ngẫu nhiên. Xoá các vector cũ
+    # theo metadata program trước khi ghi bản mới, nếu không mỗi chunk sẽ có hai bản trong chỉ mục
+    legacy_removed = 0
+    if not os.path.exists(manifest_path(document_name)):
+        legacy_removed = delete_by_program(vectorstore, document_name)
+        if legacy_removed:
+            print(f"🧹 Đã xoá {legacy_removed} vector cũ (học trước khi có manifest) của {document_name}")
+
+    def upsert_batch(ids, texts, vectors, metadatas):
+        upsert_embeddings(vectorstore, ids, texts, vectors, metadatas)
+        if bm25_index is not None:
+            bm25_index.add(ids, texts, metadatas)
+
+    pipeline_stats = run_ingestion(
+        new_chunks(),
+        get_ingest_embeddings().embed_documents,
+        upsert_batch,
+        embed_workers=max(1, INGEST_EMBED_WORKERS),
+    )
+    added = pipeline_stats["upsert"]["items"]
+    if backfill:
+        bm25_index.add(*zip(*backfill))
+        print(f"🔤 Đã bổ sung {len(backfill)} chunk vào chỉ mục BM25")
+
+    # Xoá chunk của các điều đã bị bỏ, sau khi bản mới đã vào chỉ mục
+    removed_ids = [chunk_id for chunk_id in indexed if chunk_id not in current]
+    if removed_ids:
+        vectorstore.delete(ids=removed_ids)
+        if bm25_index is not None:
+            bm25_index.delete(removed_ids)
+
+    if article_writer is not None:
+        article_writer.commit()
+
+    manifest["chunks"] = current
+    manifest["updated_at"] = time.time()
+    save_manifest(manifest)
+
+    stats = {
+        "document": document_name,
+        "total": len(current),
+        "added": added,
+        "removed": len(removed_ids),
+        "legacy_removed": legacy_removed,
+        "unchanged": len(current) - added,
+        "pipeline": pipeline_stats,
+    }
+    print(f"✅ {VECTOR_BACKEND}: {stats['added']} chunk mới, {stats['removed']} chunk bị xoá, "
+          f"{stats['unchanged']} chunk không đổi (tổng {stats['total']})")
+    return stats
+
+
+# Một regex cho mọi loại dòng, thử theo đúng thứ tự ưu tiên: Điều > 1.1 > a) > ii) > gạch đầu dòng
+CLAUSE_LINE_PATTERN = re.compile(
+    r"(?P<term>Điều\s+\d+[\.:])"
+    r"|(?P<sub>\d+\.\d+)"
+    r"|(?P<detail>[a-zA-Z]\))"
+    r"|(?P<roman>(?i:i{1,3}|iv|v|vi|vii|viii|ix|x)\))"
+    r"|(?P<bullet>- )"
+)
+UNKNOWN_TERM_TITLE = "Không rõ tiêu đề"
+
+def iter_document_lines(file_path, start_page, end_page, stats, executor=None):
+    # Dòng của từng trang, đưa thẳng vào parser để trang đầu được parse trong lúc các trang sau còn đang đọc.
+    # stats ghi lại số ký tự/số dòng và việc có text hay không (trước đây tính trên chuỗi ghép cả văn bản)
+    for page_text in iter_pages(file_path, start_page, end_page, executor):
+        page_text += "\n"
+        lines = page_text.splitlines()
+        stats["chars"] += len(page_text)
+        stats["lines"] += len(lines)
+        if not stats["has_text"] and page_text.strip():
+            stats["has_text"] = True
+        yield from lines
+
+def parse_structured_terms(lines):
+    # Dựng cây Điều > 1.1 > a) > i)/- từ các dòng. Tiêu đề được gom thành list các đoạn
+    # và chỉ nối một lần ở cuối (join_titles) thay vì cộng chuỗi lặp lại.
+    result = []
+    current_term = None
+    current_sub = None
+    current_detail = None
+    match = CLAUSE_LINE_PATTERN.match
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        matched = match(line)
+        kind = matched.lastgroup if matched else None
+
+        # Điều khoản chính: "Điều 1:", "Điều 2."
+        if kind == "term":
+            # Kết thúc khối cũ
+            if current_term:
                 if current_sub:
                     if current_detail:
                         current_sub["details"].append(current_detail)
                         current_detail = None
                     current_term["sub_items"].append(current_sub)
-                current_sub = {"title": line, "details": []}
-                current_detail = None
-
-            # Mục a), b), c)...
-            elif re.match(r"^[a-zA-Z]\)", line):
-                if current_term is None:
-                    current_term = {"title": "Không rõ tiêu đề", "sub_items": []}
-
+                    current_sub = None
+                result.append(current_term)
+            current_term = {"title": [line], "sub_items": []}
+            current_sub = None
+            current_detail = None
+
+        # Mục 1.1, 2.3,...
+        elif kind == "sub":
+            if current_term is None:
+                current_term = {"title": [UNKNOWN_TERM_TITLE], "sub_items": []}
+            if current_sub:
                 if current_detail:
                     current_sub["details"].append(current_detail)
-                current_detail = {"title": line, "sub_details": []}
-
-            # Mục i), ii), iii)...
-            elif re.match(r"^(i{1,3}|iv|v|vi|vii|viii|ix|x)\)", line, re.IGNORECASE):
-                if current_detail:
-                    current_detail["sub_details"].append(line)
-                elif current_sub:
-                    current_sub["details"].append({"title": line})
-
-            # Mục - gạch đầu dòng
-            elif re.match(r"^- ", line):
-                if current_detail:
-                    current_detail["sub_details"].append(line)
-                elif current_sub:
-                    current_sub["details"].append({"title": line})
-
-            # Dòng nối tiếp
-            else:
-                # Nếu đang ở cấp sâu nhất (i) hoặc -), nối vào dòng cuối
-                if current_detail and current_detail.get("sub_details"):
-                    current_detail["sub_details"][-1] += " " + line
-                # Nếu đang ở cấp a)
-                elif current_detail:
-                    current_detail["title"] += " " + line
-                # Nếu chỉ có cấp 1.1
-                elif current_sub:
-                    current_sub["title"] += " " + line
-                else:
-                    # Không có cấp nào - có thể lưu thành term riêng hoặc bỏ qua
-                    if current_term is None:
-                        current_term = {"title": "Không rõ tiêu đề", "sub_items": []}
-                    # Thêm dòng này vào title của current_term (hoặc tạo 1 sub mới)
-                    # Ở đây mình chọn nối vào title để tránh mất dữ liệu
-                    current_term["title"] += " " + line
-
-        # Đóng các khối còn lại
-        if current_detail:
-            current_sub["details"].append(current_detail)
-        if current_sub:
-            current_term["sub_items"].append(current_sub)
-        if current_term:
-            result.append(current_term)
-
-        if not result:
-            raise ValueError("No structured content found in the text")
-
-        print(f"Found {len(result)} terms in the text")
-        return result
-
-    except Exception as e:
-        raise Exception(f"Error processing file: {str(e)}")
-
-    try:
-        # Open document based on file extension
-        if file_path.lower().endswith('.pdf'):
-            doc = fitz.open(file_path)
-            if not doc:
-                raise ValueError("Could not open PDF file")
-            total_pages = len(doc)
-            print(f"Total pages in PDF: {total_pages}")
-        elif file_path.lower().endswith('.docx'):
-            doc = Document(file_path)
-            total_pages = len(doc.paragraphs)
-            print(f"Total paragraphs in DOCX: {total_pages}")
-        else:
-            raise ValueError("Unsupported file format. Only PDF and DOCX files are supported.")
-
-        # Validate page range
-        if start_page < 1 or start_page > total_pages:
-            raise ValueError(f"Start page {start_page} is out of range (1-{total_pages})")
-        if end_page < start_page or end_page > total_pages:
-            raise ValueError(f"End page {end_page} is out of range ({start_page}-{total_pages})")
-
-        text = ""
-        
-        # Extract text from PDF
-        if file_path.lower().endswith('.pdf'):
-            for i in range(start_page - 1, end_page):
-                try:
-                    page = doc[i]
-                    if page:
-                        page_text = page.get_text()
-                        if page_text:
-                            text += page_text + "\n"
-                            print(f"Successfully extracted text from page {i+1}")
-                        else:
-                            print(f"Warning: No text found on page {i+1}")
-                    else:
-                        print(f"Warning: Could not access page {i+1}")
-                except Exception as e:
-                    print(f"Error processing page {i+1}: {str(e)}")
-        # Extract text from DOCX
+                current_term["sub_items"].append(current_sub)
+            current_sub = {"title": [line], "details": []}
+            current_detail = None
+
+        # Mục a), b), c)...
+        elif kind == "detail":
+            if current_term is None:
+                current_term = {"title": [UNKNOWN_TERM_TITLE], "sub_items": []}
+            if current_detail:
+                current_sub["details"].append(current_detail)
+            current_detail = {"title": [line], "sub_details": []}
+
+        # Mục ii), iii)... và gạch đầu dòng
+        elif kind is not None:
+            if current_detail:
+                current_detail["sub_details"].append([line])
+            elif current_sub:
+                current_sub["details"].append({"title": [line]})
+
+        # Dòng nối tiếp: nối vào mục sâu nhất đang mở
+        elif current_detail and current_detail["sub_details"]:
+            current_detail["sub_details"][-1].append(line)
+        elif current_detail:
+            current_detail["title"].append(line)
+        elif current_sub:
+            current_sub["title"].append(line)
         else:
-            for i in range(start_page - 1, end_page):
-                try:
-                    para_text = doc.paragraphs[i].text
-                    if para_text:
-                        text += para_text + "\n"
-                        print(f"Successfully extracted text from paragraph {i+1}")
-                    else:
-                        print(f"Warning: No text found in paragraph {i+1}")
-                except Exception as e:
-                    print(f"Error processing paragraph {i+1}: {str(e)}")
-
-        if not text.strip():
+            if current_term is None:
+                current_term = {"title": [UNKNOWN_TERM_TITLE], "sub_items": []}
+            # Không có cấp nào: nối vào tiêu đề điều để tránh mất dữ liệu
+            current_term["title"].append(line)
+
+    # Đóng các khối còn lại
+    if current_detail:
+        current_sub["details"].append(current_detail)
+    if current_sub:
+        current_term["sub_items"].append(current_sub)
+    if current_term:
+        result.append(current_term)
+
+    join_titles(result)
+    return result
+
+def join_titles(terms):
+    for term in terms:
+        term["title"] = " ".join(term["title"])
+        for sub in term["sub_items"]:
+            sub["title"] = " ".join(sub["title"])
+            for detail in sub["details"]:
+                detail["title"] = " ".join(detail["title"])
+                if "sub_details" in detail:
+                    detail["sub_details"] = [" ".join(parts) for parts in detail["sub_details"]]
+
+def extract_structured_terms(file_path, start_page, end_page, executor=None):
+    try:
+        stats = {"chars": 0, "lines": 0, "has_text": False}
+        result = parse_structured_terms(iter_document_lines(file_path, start_page, end_page, stats, executor))
+        if not stats["has_text"]:
             raise ValueError("No text content found in the specified page range")
-
-        print(f"Extracted text length: {len(text)} characters")
-        lines = text.splitlines()
-        print(f"Number of lines: {len(lines)}")
-
-        result = []
-        current_term = None
-        current_sub = None
-        current_detail = None
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            # Điều khoản chính
-            if re.match(r"^Điều\s+\d+[\.:]", line):
-                if current_term:
-                    if current_sub:
-                        if current_detail:
-                            current_sub["details"].append(current_detail)
-                            current_detail = None
-                        current_term["sub_items"].append(current_sub)
-                        current_sub = None
-                    result.append(current_term)
-                current_term = {"title": line, "sub_items": []}
-
-            # Mục 1.1, 2.3,...
-            elif re.match(r"^\d+\.\d+", line):
-                if current_sub:
-                    if current_detail:
-                        current_sub["details"].append(current_detail)
-                        current_detail = None
-                    current_term["sub_items"].append(current_sub)
-                current_sub = {"title": line, "details": []}
-                current_detail = None
-
-            # Mục a), b), c)...
-            elif re.match(r"^[a-zA-Z]\)", line):
-                if current_detail:
-                    current_sub["details"].append(current_detail)
-                current_detail = {"title": line, "sub_details": []}
-
-            # Mục i), ii), iii)...
-            elif re.match(r"^(i{1,3}|iv|v|vi|vii|viii|ix|x)\)", line, re.IGNORECASE):
-                if current_detail:
-                    current_detail["sub_details"].append(line)
-                elif current_sub:
-                    current_sub["details"].append({"title": line})
-
-            # Mục - gạch đầu dòng
-            elif re.match(r"^- ", line):
-                if current_detail:
-                    current_detail["sub_details"].append(line)
-                elif current_sub:
-                    current_sub["details"].append({"title": line})
-
-            # Dòng nối tiếp
-            else:
-                # Nếu đang ở cấp sâu nhất (i) hoặc -), nối vào dòng cuối
-                if current_detail and current_detail.get("sub_details"):
-                    current_detail["sub_details"][-1] += " " + line
-                # Nếu đang ở cấp a)
-                elif current_detail:
-                    current_detail["title"] += " " + line
-                # Nếu chỉ có cấp 1.1
-                elif current_sub:
-                    current_sub["title"] += " " + line
-
-        # Đóng các khối còn lại
-        if current_detail:
-            current_sub["details"].append(current_detail)
-        if current_sub:
-            current_term["sub_items"].append(current_sub)
-        if current_term:
-            result.append(current_term)
+        print(f"Extracted text length: {stats['chars']} characters")
+        print(f"Number of lines: {stats['lines']}")
 
         if not result:
             raise ValueError("No structured content found in the text")
 
         print(f"Found {len(result)} terms in the text")
         return result
+
     except Exception as e:
         raise Exception(f"Error processing file: {str(e)}")
 
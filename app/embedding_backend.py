@@ -0,0 +1,53 @@
+import glob
+import os
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from app import config
+
+
+def quantized_model_dir(model_name):
+    return os.path.join(config.ONNX_MODEL_DIR, model_name.replace("/", "--"))
+
+
+def quantized_model_file(model_dir, quantization):
+    # export_dynamic_quantized_onnx_model đặt tên theo kiểu trọng số, ví dụ onnx/model_qint8_avx512_vnni.onnx
+    matches = sorted(glob.glob(os.path.join(model_dir, "onnx", f"model_*_{quantization}.onnx")))
+    if not matches:
+        return None
+    return os.path.relpath(matches[0], model_dir).replace(os.sep, "/")
+
+
+def export_quantized_model(model_name, quantization=None):
+    # Xuất model sang ONNX rồi lượng tử hoá động int8 cho CPU; chỉ chạy một lần, lần sau dùng lại file trên đĩa
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    quantization = quantization or config.ONNX_QUANTIZATION
+    model_dir = quantized_model_dir(model_name)
+    file_name = quantized_model_file(model_dir, quantization)
+    if file_name:
+        return model_dir, file_name
+    print(f"🔧 Đang xuất {model_name} sang ONNX int8 ({quantization}) vào {model_dir}")
+    model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+    model.save(model_dir)
+    export_dynamic_quantized_onnx_model(model, quantization, model_dir)
+    return model_dir, quantized_model_file(model_dir, quantization)
+
+
+def create_embeddings(backend=None, model_name=None, encode_kwargs=None):
+    # "torch": model gốc fp32; "onnx-int8": bản ONNX đã lượng tử hoá int8 chạy bằng onnxruntime
+    backend = backend or config.EMBEDDING_BACKEND
+    model_name = model_name or config.EMBEDDING_MODEL
+    if encode_kwargs is None:
+        encode_kwargs = {'normalize_embeddings': True, 'batch_size': config.EMBED_BATCH_SIZE}
+    if backend == "torch":
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs=encode_kwargs
+        )
+    if backend == "onnx-int8":
+        model_dir, file_name = export_quantized_model(model_name)
+        return HuggingFaceEmbeddings(
+            model_name=model_dir,
+            model_kwargs={'device': 'cpu', 'backend': 'onnx', 'model_kwargs': {'file_name': file_name}},
+            encode_kwargs=encode_kwargs
+        )
+    raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend}")
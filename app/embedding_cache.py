@@ -0,0 +1,166 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.config import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES
+)
+
+
+def normalize_text(text):
+    # Chỉ gộp khoảng trắng: không đổi chữ hoa/thường hay dạng Unicode vì tokenizer phân biệt các khác biệt đó
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    # Vector float16 trong một file memory-mapped gồm max_entries ô cố định; SQLite giữ khoá -> ô và thời điểm dùng gần nhất.
+    # Khi đầy, bỏ 10% ô ít được dùng nhất (LRU) rồi dùng lại các ô đó.
+    def __init__(self, directory, dim, max_entries):
+        self.directory = directory
+        self.dim = dim
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        vectors_path = os.path.join(directory, "vectors.f16")
+        # Tạo mới hoặc co/giãn file theo max_entries hiện tại (phần mới là file thưa, không chiếm đĩa ngay)
+        with open(vectors_path, "ab") as f:
+            f.truncate(max_entries * dim * 2)
+        self._vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(max_entries, dim))
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        self._conn.commit()
+        # Các ô trống: ô chưa từng dùng hoặc đã bị bỏ (kể cả khi max_entries nhỏ hơn lần chạy trước)
+        self._conn.execute("DELETE FROM entries WHERE slot >= ?", (max_entries,))
+        self._conn.commit()
+        used = {row[0] for row in self._conn.execute("SELECT slot FROM entries")}
+        self._free = [slot for slot in range(max_entries - 1, -1, -1) if slot not in used]
+
+    @staticmethod
+    def make_key(namespace, text):
+        raw = namespace + "\x1e" + normalize_text(text)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        # Trả về {key: list float} cho các khoá đã có
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, slot in rows:
+                    found[key] = self._vectors[slot].astype(np.float32).tolist()
+            if found:
+                self._conn.executemany("UPDATE entries SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, keys, vectors):
+        now = time.time()
+        with self._lock:
+            for key, vector in dict(zip(keys, vectors)).items():
+                existing = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if existing:
+                    slot = existing[0]
+                else:
+                    if not self._free:
+                        self._evict()
+                    slot = self._free.pop()
+                self._vectors[slot] = np.asarray(vector, dtype=np.float16)
+                # Ghi ngay từng khoá để lần _evict sau trong cùng lô không lấy lại ô vừa cấp
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, slot, last_access) VALUES (?, ?, ?)", (key, slot, now)
+                )
+            self._conn.commit()
+
+    def _evict(self):
+        drop = max(1, self.max_entries // 10)
+        rows = self._conn.execute(
+            "SELECT key, slot FROM entries ORDER BY last_access ASC LIMIT ?", (drop,)
+        ).fetchall()
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows])
+        self._free.extend(slot for _, slot in rows)
+
+    def flush(self):
+        with self._lock:
+            self._vectors.flush()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._free = list(range(self.max_entries - 1, -1, -1))
+        print("🧹 Đã xoá cache embedding")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    # Bọc một Embeddings bất kỳ: chỉ embed các văn bản chưa có trong cache
+    def __init__(self, embeddings, cache, namespace):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = namespace
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [self.cache.make_key(self.namespace + ":document", text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing), vectors)
+            found.update(zip(missing, vectors))
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self.cache.make_key(self.namespace + ":query", text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many([key], [vector])
+        return vector
+
+
+def embedding_namespace(backend=EMBEDDING_BACKEND, model_name=EMBEDDING_MODEL):
+    return f"{backend}:{model_name}"
+
+
+def create_embedding_cache(dim, namespace):
+    # Mỗi model/backend một thư mục riêng vì số chiều và giá trị vector khác nhau
+    directory = os.path.join(EMBEDDING_CACHE_DIR, hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:12])
+    return EmbeddingCache(directory, dim, EMBEDDING_CACHE_MAX_ENTRIES) if EMBEDDING_CACHE_ENABLED else None
@@ -0,0 +1,54 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.embeddings import Embeddings
+
+# Model trong mỗi process con, nạp một lần bởi _init_worker
+_worker_embeddings = None
+
+
+def _init_worker(backend, model_name, threads, encode_kwargs):
+    global _worker_embeddings
+    import torch
+    from app.embedding_backend import create_embeddings
+    torch.set_num_threads(threads)
+    _worker_embeddings = create_embeddings(backend, model_name, encode_kwargs)
+
+
+def _embed_batch(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _embed_query(text):
+    return _worker_embeddings.embed_query(text)
+
+
+class ParallelEmbeddings(Embeddings):
+    # Chia các lô chunk cho nhiều process, mỗi process giữ một bản bi-encoder.
+    # Mỗi lô được encode nguyên vẹn trong một process nên vector giống hệt khi chạy một process với cùng batch_size.
+    def __init__(self, model_name, workers, threads=1, encode_kwargs=None, backend="torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers
+        self.encode_kwargs = dict(encode_kwargs or {})
+        self.batch_size = self.encode_kwargs.get("batch_size", 32)
+        # spawn thay vì fork: process cha đã có model và thread pool của torch
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend, model_name, threads, self.encode_kwargs),
+        )
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        vectors = []
+        for batch_vectors in self._executor.map(_embed_batch, batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_query(self, text):
+        return self._executor.submit(_embed_query, text).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
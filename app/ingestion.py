@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from app.config import EMBED_BATCH_SIZE, INGEST_QUEUE_SIZE
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name, unit, workers=1):
+        self.name = name
+        self.unit = unit
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    @property
+    def per_second(self):
+        # busy cộng dồn qua các luồng của bước, nên chia lại cho số luồng
+        return self.items * self.workers / self.busy if self.busy else 0.0
+
+    def to_dict(self):
+        return {
+            "items": self.items,
+            "workers": self.workers,
+            "busy_seconds": self.busy,
+            "per_second": self.per_second,
+        }
+
+
+def run_ingestion(chunks, embed_batch, upsert_batch, batch_size=EMBED_BATCH_SIZE, queue_size=INGEST_QUEUE_SIZE,
+                  embed_workers=1):
+    # Pipeline chunk -> embed -> upsert, mỗi bước một luồng, nối với nhau bằng hàng đợi giới hạn
+    # (tối đa queue_size lô mỗi hàng đợi) để embed chạy chồng lên upsert và bộ nhớ không phụ thuộc độ dài văn bản.
+    # chunks: iterator các (chunk_id, Document) cần đưa vào chỉ mục
+    # embed_batch(texts) -> vectors; upsert_batch(ids, texts, vectors, metadatas)
+    # embed_workers: số luồng gọi embed_batch song song (dùng khi embed_batch đẩy lô sang pool process)
+    embed_workers = max(1, embed_workers)
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_upsert = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    stats = {
+        "chunk": StageStats("chunk", "chunk"),
+        "embed": StageStats("embed", "chunk", embed_workers),
+        "upsert": StageStats("upsert", "chunk"),
+    }
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def chunk_stage():
+        stage = stats["chunk"]
+        batch = []
+        iterator = iter(chunks)
+        while not stop.is_set():
+            start = time.perf_counter()
+            item = next(iterator, _DONE)
+            if item is _DONE:
+                stage.add(0, time.perf_counter() - start)
+                break
+            stage.add(1, time.perf_counter() - start)
+            batch.append(item)
+            if len(batch) >= batch_size:
+                put(to_embed, batch)
+                batch = []
+        if batch:
+            put(to_embed, batch)
+
+    def embed_stage():
+        stage = stats["embed"]
+        while True:
+            batch = get(to_embed)
+            if batch is _DONE:
+                break
+            start = time.perf_counter()
+            texts = [doc.page_content for _, doc in batch]
+            vectors = embed_batch(texts)
+            stage.add(len(batch), time.perf_counter() - start)
+            put(to_upsert, (batch, vectors))
+
+    def upsert_stage():
+        stage = stats["upsert"]
+        while True:
+            item = get(to_upsert)
+            if item is _DONE:
+                break
+            batch, vectors = item
+            start = time.perf_counter()
+            upsert_batch(
+                [chunk_id for chunk_id, _ in batch],
+                [doc.page_content for _, doc in batch],
+                vectors,
+                [doc.metadata for _, doc in batch],
+            )
+            stage.add(len(batch), time.perf_counter() - start)
+
+    embed_running = [embed_workers]
+    embed_lock = threading.Lock()
+
+    def run(stage_fn, downstream):
+        try:
+            stage_fn()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if stage_fn is embed_stage:
+                # Mỗi luồng embed nhận một _DONE; chỉ luồng kết thúc cuối cùng báo xong cho bước upsert
+                put(to_embed, _DONE)
+                with embed_lock:
+                    embed_running[0] -= 1
+                    last = embed_running[0] == 0
+                if not last:
+                    return
+            if downstream is not None:
+                put(downstream, _DONE)
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(chunk_stage, to_embed), name="ingest-chunk")]
+    threads += [
+        threading.Thread(target=run, args=(embed_stage, to_upsert), name=f"ingest-embed-{i}")
+        for i in range(embed_workers)
+    ]
+    threads.append(threading.Thread(target=run, args=(upsert_stage, None), name="ingest-upsert"))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    if errors:
+        raise errors[0]
+
+    report = " | ".join(
+        f"{stage.name}: {stage.items} {stage.unit}, "
+        f"{stage.per_second:.1f} {stage.unit}/s"
+        for stage in stats.values()
+    )
+    print(f"⏱️ Ingestion {elapsed:.1f}s — {report}")
+    result = {name: stage.to_dict() for name, stage in stats.items()}
+    result["elapsed_seconds"] = elapsed
+    return result
@@ -0,0 +1,140 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app.config import JOB_WORKERS, JOB_RETENTION_SECONDS
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # Trạng thái: queued -> running -> completed | failed | cancelled
+    def __init__(self, owner, params):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.params = params
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total = 0
+        self.done = 0
+        # Kết quả từng mục, luôn theo đúng thứ tự của process_json
+        self.results = []
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    def clause_done(self, count=1):
+        with self._lock:
+            self.done += count
+
+    def add_result(self, entry):
+        with self._lock:
+            self.results.append(entry)
+
+    def get_results(self, offset=0):
+        with self._lock:
+            return self.results[offset:]
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def eta(self):
+        if not self.started_at or not self.done or self.finished:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.done * (self.total - self.done)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "done": self.done,
+            "total": self.total,
+            "results_available": len(self.results),
+            "eta": self.eta(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    # Chạy job trên pool luồng riêng, tách khỏi event loop của HTTP
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, owner, params):
+        self._cleanup()
+        job = Job(owner, params)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job.cancelled:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.started_at = time.time()
+        job.status = "running"
+        status = "completed"
+        try:
+            job.result = fn(job)
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            print(f"Job {job.id} failed: {str(e)}")
+            job.error = getattr(e, "detail", None) or str(e)
+            status = "failed"
+        job.finished_at = time.time()
+        job.status = status
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, owner=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if owner is None or job.owner == owner]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job and not job.finished:
+            job.cancel_event.set()
+        return job
+
+    def _cleanup(self):
+        # Bỏ các job đã xong quá JOB_RETENTION_SECONDS để không giữ kết quả mãi trong bộ nhớ
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.finished_at > JOB_RETENTION_SECONDS]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+job_manager = JobManager(JOB_WORKERS)
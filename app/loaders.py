@@ -0,0 +1,274 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import docx
+import docx2txt
+import fitz  # PyMuPDF
+from app.config import (
+    PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK,
+    EXTRACT_CACHE_ENABLED, EXTRACT_CACHE_PATH, EXTRACT_CACHE_MAX_FILES
+)
+
+# Đơn vị "trang" của từng loại file. Có phiên bản PyMuPDF trong tên để cache tự bỏ khi đổi thư viện trích xuất
+PDF_PAGE = f"pdf-page:{fitz.VersionBind}"
+# /process đánh số DOCX theo đoạn văn (python-docx), /learn lấy cả văn bản bằng docx2txt như trước
+DOCX_PARAGRAPH = "docx-paragraph"
+DOCX_TEXT = "docx-text"
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_unit(file_path, docx_unit=DOCX_PARAGRAPH):
+    if file_path.lower().endswith('.pdf'):
+        return PDF_PAGE
+    if file_path.lower().endswith('.docx'):
+        return docx_unit
+    raise ValueError("Unsupported file format. Only PDF and DOCX files are supported.")
+
+
+def check_page_range(start_page, end_page, total_pages):
+    if start_page < 1 or start_page > total_pages:
+        raise ValueError(f"Start page {start_page} is out of range (1-{total_pages})")
+    if end_page < start_page or end_page > total_pages:
+        raise ValueError(f"End page {end_page} is out of range ({start_page}-{total_pages})")
+
+
+class ExtractCache:
+    # Text đã trích xuất theo hash nội dung file: mỗi trang/đoạn một dòng SQLite, đọc lại được theo phạm vi.
+    # Giữ tối đa max_files file, bỏ file lâu không dùng nhất khi vượt.
+    def __init__(self, path, max_files):
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                file_hash TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (file_hash, unit)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                file_hash TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (file_hash, unit, page)
+            )
+        """)
+        self._conn.commit()
+
+    def get_total(self, key, unit):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total FROM files WHERE file_hash = ? AND unit = ?", (key, unit)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE files SET last_access = ? WHERE file_hash = ? AND unit = ?", (time.time(), key, unit)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def set_total(self, key, unit, total):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_hash, unit, total, last_access) VALUES (?, ?, ?, ?)",
+                (key, unit, total, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def has_range(self, key, unit, start_page, end_page):
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM pages WHERE file_hash = ? AND unit = ? AND page BETWEEN ? AND ?",
+                (key, unit, start_page, end_page)
+            ).fetchone()[0]
+        found = count == end_page - start_page + 1
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def iter_range(self, key, unit, start_page, end_page, block=256):
+        # Đọc từng khối trang để không giữ khoá (và bộ nhớ) cho cả văn bản
+        for start in range(start_page, end_page + 1, block):
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT page, text FROM pages WHERE file_hash = ? AND unit = ? AND page BETWEEN ? AND ? ORDER BY page",
+                    (key, unit, start, min(start + block - 1, end_page))
+                ).fetchall()
+            for page, text in rows:
+                yield page, text, None
+
+    def store(self, key, unit, pages, block=64):
+        # Chuyển tiếp các trang cho người đọc, đồng thời ghi theo lô các trang đọc thành công vào cache
+        rows = []
+        for page in pages:
+            yield page
+            page_number, text, error = page
+            if error is None:
+                rows.append((key, unit, page_number, text))
+            if len(rows) >= block:
+                self._insert(rows)
+                rows = []
+        if rows:
+            self._insert(rows)
+
+    def _insert(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (file_hash, unit, page, text) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        if count <= self.max_files:
+            return
+        rows = self._conn.execute(
+            "SELECT file_hash, unit FROM files ORDER BY last_access ASC LIMIT ?", (count - self.max_files,)
+        ).fetchall()
+        self._conn.executemany("DELETE FROM pages WHERE file_hash = ? AND unit = ?", rows)
+        self._conn.executemany("DELETE FROM files WHERE file_hash = ? AND unit = ?", rows)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+        print("🧹 Đã xoá cache text trích xuất")
+
+    def stats(self):
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "files": files,
+            "pages": pages,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+extract_cache = ExtractCache(EXTRACT_CACHE_PATH, EXTRACT_CACHE_MAX_FILES) if EXTRACT_CACHE_ENABLED else None
+
+
+def read_pdf_pages(doc, start, end):
+    # (số trang, text, lỗi) cho các trang [start, end) của một file PDF đã mở
+    for i in range(start, end):
+        try:
+            yield i + 1, doc[i].get_text(), None
+        except Exception as e:
+            yield i + 1, None, str(e)
+
+
+def extract_pdf_pages(file_path, start, end):
+    # Chạy trong process con: tự mở file, đọc một đoạn trang rồi đóng
+    with fitz.open(file_path) as doc:
+        return list(read_pdf_pages(doc, start, end))
+
+
+def iter_parallel_pdf_pages(file_path, start_page, end_page, executor):
+    # Chia thành các đoạn PDF_PAGES_PER_TASK trang cho process pool, ghép kết quả lại theo đúng thứ tự trang
+    futures = [
+        executor.submit(extract_pdf_pages, file_path, start, min(start + PDF_PAGES_PER_TASK, end_page))
+        for start in range(start_page - 1, end_page, PDF_PAGES_PER_TASK)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def open_document(file_path, unit):
+    # Trả về (tổng số trang, hàm đọc(start_page, end_page, executor) -> iterator (số trang, text, lỗi))
+    if unit == PDF_PAGE:
+        with fitz.open(file_path) as doc:
+            if not doc:
+                raise ValueError("Could not open PDF file")
+            total = len(doc)
+
+        def read(start_page, end_page, executor):
+            # Văn bản ngắn đọc tuần tự: chi phí gửi việc sang process lớn hơn phần tiết kiệm được
+            if executor is None or end_page - start_page + 1 < PDF_PARALLEL_MIN_PAGES:
+                with fitz.open(file_path) as doc:
+                    yield from read_pdf_pages(doc, start_page - 1, end_page)
+            else:
+                yield from iter_parallel_pdf_pages(file_path, start_page, end_page, executor)
+        return total, read
+
+    if unit == DOCX_PARAGRAPH:
+        paragraphs = docx.Document(file_path).paragraphs
+
+        def read(start_page, end_page, executor):
+            for i in range(start_page - 1, end_page):
+                yield i + 1, paragraphs[i].text, None
+        return len(paragraphs), read
+
+    def read(start_page, end_page, executor):
+        yield 1, docx2txt.process(file_path), None
+    return 1, read
+
+
+def iter_pages(file_path, start_page=None, end_page=None, executor=None, docx_unit=DOCX_PARAGRAPH):
+    # Sinh text từng trang (PDF) hoặc đoạn văn/cả văn bản (DOCX) trong phạm vi, đánh số từ 1, bỏ qua trang rỗng.
+    # Lấy từ cache theo hash file nếu đã trích xuất trước đó; nếu không, đọc bằng PyMuPDF / python-docx / docx2txt
+    # (PDF dài đọc song song khi có executor) và ghi vào cache trong lúc đọc.
+    unit = page_unit(file_path, docx_unit)
+    cache = extract_cache
+    key = file_hash(file_path) if cache else None
+    total = cache.get_total(key, unit) if cache else None
+    read = None
+    if total is None:
+        total, read = open_document(file_path, unit)
+        if cache:
+            cache.set_total(key, unit, total)
+    if unit == PDF_PAGE:
+        print(f"Total pages in PDF: {total}")
+    elif unit == DOCX_PARAGRAPH:
+        print(f"Total paragraphs in DOCX: {total}")
+    start_page = start_page or 1
+    end_page = end_page or total
+    check_page_range(start_page, end_page, total)
+
+    if cache and cache.has_range(key, unit, start_page, end_page):
+        pages = cache.iter_range(key, unit, start_page, end_page)
+    else:
+        if read is None:
+            _, read = open_document(file_path, unit)
+        pages = read(start_page, end_page, executor)
+        if cache:
+            pages = cache.store(key, unit, pages)
+
+    empty = []
+    for page_number, text, error in pages:
+        if error is not None:
+            print(f"Error processing page {page_number}: {error}")
+        elif text:
+            yield text
+        else:
+            empty.append(page_number)
+    if empty:
+        print(f"Warning: No text found in {len(empty)} page(s)/paragraph(s): {empty[:20]}{'...' if len(empty) > 20 else ''}")
@@ -1,9 +1,21 @@
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
 from app.config import *
+from app import config
 from app.document_processor import embeddings
+from app.vector_store import get_vectorstore
+from app.rate_limiter import call_with_retry
+from app.answer_cache import answer_cache, document_id
+from app.semantic_cache import semantic_cache
+from app.bm25_index import HybridRetriever, get_bm25_index
+from app.article_index import get_article_index
+from app.reranker import get_reranker
+from app.context_builder import context_builder
+from app.retrieval_plan import RetrievalPlan
+import hashlib
+import json
+import threading
 import time
 qa_prompt = PromptTemplate(
     input_variables=["context", "question"],
@@ -27,30 +39,296 @@ Trả lời:
 """.strip()
 )
 
+# Prompt đánh giá gộp nhiều điều khoản anh em, trả về JSON để tách kết quả cho từng điều khoản
+batch_prompt = PromptTemplate(
+    input_variables=["context", "clauses"],
+    template="""
+Bạn là một trợ lý thông minh. Hãy sử dụng thông tin dưới đây để đánh giá từng điều khoản được đánh số.
+Nếu không tìm thấy thông tin liên quan cho một điều khoản, hãy ghi lý do là "Không tìm thấy tài liệu liên quan".
+
+Thông tin:
+{context}
+
+Các điều luật, quyết định, quy định hoặc quy chế cần đánh giá:
+{clauses}
+
+Yêu cầu
+- Đánh giá từng điều khoản trên 3 mức: phù hợp, không phù hợp, cần xem xét thêm.
+- Lý do đánh giá.
+- Nếu không phù hợp gợi ý sửa đổi.
+
+Chỉ trả lời bằng một mảng JSON, mỗi điều khoản một phần tử theo đúng số thứ tự, không kèm nội dung nào khác:
+[{{"id": 1, "danh_gia": "phù hợp | không phù hợp | cần xem xét thêm", "ly_do": "...", "goi_y": "..."}}]
+""".strip()
+)
+
+VERDICTS = ("phù hợp", "không phù hợp", "cần xem xét thêm")
+
+# Đổi prompt thì các câu trả lời đã cache cho prompt cũ tự động không còn được dùng. Câu trả lời được sinh từ
+# ngữ cảnh đã ghép/cắt nên thiết lập dựng ngữ cảnh (hoặc việc tắt nó) cũng thuộc phiên bản prompt.
+CONTEXT_VERSION = context_builder.version if context_builder else "raw"
+PROMPT_VERSION = hashlib.sha1((qa_prompt.template + CONTEXT_VERSION).encode("utf-8")).hexdigest()[:12]
+BATCH_PROMPT_VERSION = hashlib.sha1((batch_prompt.template + CONTEXT_VERSION).encode("utf-8")).hexdigest()[:12]
+# Semantic cache dùng chung cho câu trả lời đơn lẻ lẫn theo lô nên gắn cả hai phiên bản prompt cùng LLM
+SEMANTIC_VERSION = f"{PROMPT_VERSION}:{BATCH_PROMPT_VERSION}:{LLM_MODEL}"
+
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
+    model=LLM_MODEL,
     google_api_key=GOOGLE_API_KEY,
-    temperature=0.01
+    temperature=0.01,
+    # Retry khi hết quota do call_with_retry đảm nhiệm
+    max_retries=1
 )
 
+def final_k():
+    # Số chunk đưa vào prompt: RERANK_TOP_N khi có bước xếp hạng lại, nếu không thì RETRIEVER_K
+    return config.RERANK_TOP_N if config.RERANK_ENABLED else config.RETRIEVER_K
+
 def create_qa_chain():
-    vectorstore = PineconeVectorStore.from_existing_index(
-        index_name=PINECONE_INDEX_NAME,
-        embedding=embeddings
-    )
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+    vectorstore = get_vectorstore(embeddings)
+    bm25_index = get_bm25_index()
+    # Có xếp hạng lại thì truy xuất rộng (RERANK_CANDIDATES) để cross-encoder chọn ra final_k() chunk
+    k = config.RERANK_CANDIDATES if config.RERANK_ENABLED else config.RETRIEVER_K
+    if bm25_index is not None:
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            index=bm25_index,
+            search_kwargs={"k": k},
+            fetch_k=config.HYBRID_FETCH_K,
+            rrf_k=config.RRF_K,
+        )
+    else:
+        retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
 
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
         retriever=retriever,
         return_source_documents=True,
-        verbose=True,
+        verbose=False,
         chain_type_kwargs={"prompt": qa_prompt}
     )
     return qa_chain
 
-def answer_question(question, qa_chain):
-    time.sleep(5)
-    result = qa_chain({"query": question})
-    return result["result"], result["source_documents"]
+# Chain/retriever dùng chung cho cả process, chỉ dựng lại khi cấu hình chỉ mục thay đổi
+_qa_chain_lock = threading.Lock()
+_qa_chain_entry = None
+
+def qa_chain_config_key():
+    return (config.VECTOR_BACKEND, config.PINECONE_INDEX_NAME, config.LOCAL_INDEX_DIR, config.LOCAL_INDEX_SEARCH,
+            config.EMBEDDING_MODEL, config.LLM_MODEL, config.RETRIEVER_K,
+            config.HYBRID_SEARCH_ENABLED, config.BM25_INDEX_DIR, config.HYBRID_FETCH_K, config.RRF_K,
+            config.RERANK_ENABLED, config.RERANK_CANDIDATES)
+
+def get_qa_chain():
+    global _qa_chain_entry
+    key = qa_chain_config_key()
+    entry = _qa_chain_entry
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    with _qa_chain_lock:
+        if _qa_chain_entry is None or _qa_chain_entry[0] != key:
+            start_time = time.time()
+            _qa_chain_entry = (key, create_qa_chain())
+            print(f"🔧 Đã khởi tạo QA chain trong {time.time() - start_time:.2f}s")
+        return _qa_chain_entry[1]
+
+def warm_up():
+    # Gọi lúc khởi động: dựng chain, nạp model embedding và mở kết nối tới chỉ mục trước request đầu tiên
+    start_time = time.time()
+    qa_chain = get_qa_chain()
+    documents = qa_chain.retriever.invoke("Điều 1")
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.rerank("Điều 1", documents, final_k())
+    print(f"🔥 Warm-up QA chain xong trong {time.time() - start_time:.2f}s")
+
+def embed_questions(questions):
+    # Embed toàn bộ câu hỏi của một văn bản theo lô thay vì từng câu một
+    if not questions:
+        return []
+    return embeddings.embed_documents(questions)
+
+def create_retrieval_plan(qa_chain):
+    # None khi tắt RETRIEVAL_POOL_ENABLED
+    if not config.RETRIEVAL_POOL_ENABLED:
+        return None
+    return RetrievalPlan(qa_chain.retriever.vectorstore, config.RETRIEVAL_POOL_SIZE)
+
+def search(question, retriever, vector=None, pool=None):
+    # Có sẵn vector câu hỏi thì tìm thẳng trên vector store, không embed lại;
+    # có tập ứng viên chung của nhóm thì chọn trong đó, không truy vấn vector store
+    if vector is None:
+        return retriever.invoke(question)
+    if pool is not None:
+        if isinstance(retriever, HybridRetriever):
+            return retriever.fuse(question, pool.narrow(vector, retriever.dense_k))
+        return pool.narrow(vector, retriever.search_kwargs.get("k", config.RETRIEVER_K))
+    if isinstance(retriever, HybridRetriever):
+        return retriever.search(question, vector)
+    return retriever.vectorstore.similarity_search_by_vector(vector, **retriever.search_kwargs)
+
+def retrieve(question, qa_chain, vector=None, pool=None):
+    # Điều luật được trích dẫn rõ ràng lấy thẳng từ chỉ mục điều luật, chỉ tìm tương đồng cho các chỗ còn lại.
+    # Bật RERANK_ENABLED thì các ứng viên tìm được được cross-encoder chấm lại trước khi lấy phần còn lại.
+    retriever = qa_chain.retriever
+    article_index = get_article_index()
+    reranker = get_reranker()
+    k = final_k()
+    cited = article_index.lookup(question, limit=k) if article_index is not None else []
+    if len(cited) >= k:
+        return cited
+    seen = {document_id(doc) for doc in cited}
+    documents = [doc for doc in search(question, retriever, vector, pool) if document_id(doc) not in seen]
+    if reranker is not None:
+        documents = reranker.rerank(question, documents, k - len(cited))
+    return cited + documents[:k - len(cited)]
+
+def semantic_lookup(question, vector=None):
+    # Trả về (entry hoặc None, vector câu hỏi)
+    if not semantic_cache:
+        return None, vector
+    if vector is None:
+        vector = embeddings.embed_query(question)
+    hit = semantic_cache.lookup(vector, SEMANTIC_VERSION)
+    if not hit:
+        return None, vector
+    entry, score = hit
+    print(f"♻️ Dùng lại câu trả lời (cosine={score:.3f}) của: {entry['question'][:80]}")
+    return entry, vector
+
+def cached_answer(question, documents, prompt_version=PROMPT_VERSION):
+    # Trả về (key, answer hoặc None) từ cache câu trả lời
+    if not answer_cache:
+        return None, None
+    key = answer_cache.make_key(question, documents, prompt_version, LLM_MODEL)
+    return key, answer_cache.get(key)
+
+def remember_answer(question, vector, key, answer, documents):
+    if answer_cache:
+        answer_cache.set(key, answer)
+    if semantic_cache:
+        semantic_cache.add(question, vector, answer, documents, SEMANTIC_VERSION)
+
+def answer_question(question, qa_chain, vector=None, pool=None):
+    # Trả về (answer, documents, cached) với cached là None, "exact" hoặc "semantic"
+    entry, vector = semantic_lookup(question, vector)
+    if entry:
+        return entry["answer"], entry["documents"], "semantic"
+
+    # Truy xuất trước để khoá cache gồm cả các chunk tham chiếu, chỉ gọi LLM khi cache miss
+    documents = retrieve(question, qa_chain, vector, pool)
+    return answer_single(question, documents, vector, qa_chain)
+
+def answer_single(question, documents, vector, qa_chain):
+    key, answer = cached_answer(question, documents)
+    if answer is not None:
+        return answer, documents, "exact"
+    answer = generate_answer(question, documents, qa_chain)
+    remember_answer(question, vector, key, answer, documents)
+    return answer, documents, None
+
+def build_context(documents, clauses=1):
+    # Ngữ cảnh đã ghép/loại trùng, vừa CONTEXT_TOKEN_BUDGET token cho mỗi điều khoản
+    if context_builder is None:
+        return documents
+    context, _ = context_builder.build(documents, budget=context_builder.budget * clauses)
+    return context
+
+def generate_answer(question, documents, qa_chain):
+    context = build_context(documents)
+    return call_with_retry(lambda: qa_chain.combine_documents_chain.invoke(
+        {"input_documents": context, "question": question}
+    )["output_text"])
+
+def parse_batch_verdicts(raw, count):
+    # Đọc mảng JSON do LLM trả về; None nếu sai định dạng hoặc thiếu điều khoản
+    text = raw.strip()
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    verdicts = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            return None
+        try:
+            clause_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            return None
+        verdict = str(item.get("danh_gia", "")).strip().lower().rstrip(".")
+        if verdict not in VERDICTS or not 1 <= clause_id <= count:
+            return None
+        verdicts[clause_id] = {
+            "danh_gia": verdict,
+            "ly_do": str(item.get("ly_do") or "").strip(),
+            "goi_y": str(item.get("goi_y") or "").strip(),
+        }
+    if len(verdicts) != count:
+        return None
+    return [verdicts[i] for i in range(1, count + 1)]
+
+def format_verdict(verdict):
+    answer = f"**Đánh giá:** {verdict['danh_gia'].capitalize()}.\n\n**Lý do:** {verdict['ly_do']}"
+    if verdict["danh_gia"] == "không phù hợp" and verdict["goi_y"]:
+        answer += f"\n\n**Gợi ý sửa đổi:** {verdict['goi_y']}"
+    return answer
+
+def answer_questions_batch(questions, qa_chain, vectors=None, pools=None):
+    # Đánh giá nhiều điều khoản anh em trong một lượt gọi LLM với ngữ cảnh đã loại trùng.
+    # Trả về danh sách (answer, documents, cached) theo đúng thứ tự questions.
+    vectors = vectors or [None] * len(questions)
+    pools = pools or [None] * len(questions)
+    if len(questions) == 1:
+        return [answer_question(questions[0], qa_chain, vectors[0], pools[0])]
+
+    outputs = [None] * len(questions)
+    pending = []
+    for i, question in enumerate(questions):
+        entry, vector = semantic_lookup(question, vectors[i])
+        if entry:
+            outputs[i] = (entry["answer"], entry["documents"], "semantic")
+            continue
+        documents = retrieve(question, qa_chain, vector, pools[i])
+        key, answer = cached_answer(question, documents, BATCH_PROMPT_VERSION)
+        if answer is not None:
+            outputs[i] = (answer, documents, "exact")
+            continue
+        pending.append((i, question, documents, vector, key))
+
+    if len(pending) < 2:
+        # Không còn gì để gộp: hỏi riêng (có thể trúng cache của prompt đơn)
+        for i, question, documents, vector, _ in pending:
+            outputs[i] = answer_single(question, documents, vector, qa_chain)
+        return outputs
+
+    # Lần lượt chunk hạng 1 của mọi điều khoản, rồi hạng 2, ... để khi cắt theo ngân sách token
+    # không điều khoản nào bị mất hết ngữ cảnh
+    context_documents = []
+    seen = set()
+    for rank in range(max(len(documents) for _, _, documents, _, _ in pending)):
+        for _, _, documents, _, _ in pending:
+            if rank >= len(documents):
+                continue
+            doc_id = document_id(documents[rank])
+            if doc_id not in seen:
+                seen.add(doc_id)
+                context_documents.append(documents[rank])
+    context = "\n\n".join(doc.page_content for doc in build_context(context_documents, len(pending)))
+    clauses = "\n\n".join(f"{n}. {question}" for n, (_, question, _, _, _) in enumerate(pending, 1))
+    raw = call_with_retry(lambda: llm.invoke(batch_prompt.format(context=context, clauses=clauses)).content)
+
+    verdicts = parse_batch_verdicts(raw, len(pending))
+    if verdicts is None:
+        print(f"⚠️ Không đọc được kết quả gộp {len(pending)} điều khoản, chuyển sang hỏi từng điều khoản")
+    for n, (i, question, documents, vector, key) in enumerate(pending):
+        if verdicts is None:
+            outputs[i] = answer_single(question, documents, vector, qa_chain)
+        else:
+            answer = format_verdict(verdicts[n])
+            remember_answer(question, vector, key, answer, documents)
+            outputs[i] = (answer, documents, None)
+    return outputs
@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+from app.config import LLM_RPM, LLM_BURST, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX
+
+
+class RateLimiter:
+    # Token bucket dùng chung giữa các luồng: nạp lại `rpm` lượt mỗi phút, dồn tối đa `burst` lượt.
+    # Khi API báo hết quota thì giảm tốc độ (x0.8), mỗi lượt thành công lại tăng dần về `rpm`.
+    def __init__(self, rpm, burst=1):
+        self.rpm = rpm
+        self.burst = max(1, burst)
+        self._max_rate = rpm / 60.0
+        self._min_rate = 1 / 60.0
+        self._rate = self._max_rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self):
+        # Chặn cho tới khi có lượt gọi, trả về số giây đã phải chờ
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self._rate)
+            time.sleep(wait)
+            waited += wait
+
+    @property
+    def current_rpm(self):
+        return self._rate * 60
+
+    def record_success(self):
+        with self._lock:
+            if self._rate < self._max_rate:
+                self._rate = min(self._max_rate, self._rate + self._max_rate * 0.05)
+
+    def penalize(self, seconds):
+        # API báo hết quota: xả bucket, giảm tốc độ và tạm dừng mọi lượt gọi trong `seconds` giây
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._rate = max(self._min_rate, self._rate * 0.8)
+            self._blocked_until = max(self._blocked_until, now + seconds)
+
+
+def is_quota_error(error):
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("429", "resource_exhausted", "resource has been exhausted", "quota", "rate limit"))
+
+
+def call_with_retry(fn, limiter=None, max_retries=LLM_MAX_RETRIES,
+                    backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX):
+    # Gọi fn() sau khi lấy lượt từ limiter; nếu hết quota thì lùi theo cấp số nhân rồi thử lại
+    limiter = limiter or llm_rate_limiter
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_quota_error(e) or attempt >= max_retries:
+                raise
+            delay = min(backoff_max, backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            print(f"⏳ Hết quota LLM, thử lại sau {delay:.1f}s (lần {attempt + 1}/{max_retries})")
+            limiter.penalize(delay)
+            attempt += 1
+        else:
+            limiter.record_success()
+            return result
+
+
+# Limiter dùng chung cho mọi job /process trong cùng process
+llm_rate_limiter = RateLimiter(LLM_RPM, LLM_BURST)
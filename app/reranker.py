@@ -0,0 +1,88 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from sentence_transformers import CrossEncoder
+from app import config
+from app.answer_cache import document_id, normalize_question
+
+
+class Reranker:
+    # Chấm điểm lại các cặp (câu hỏi, chunk) bằng cross-encoder trên CPU, theo lô.
+    # Điểm được nhớ theo (hash câu hỏi đã chuẩn hoá, id chunk) trong một LRU trong RAM.
+    def __init__(self, model_name, batch_size=16, max_length=512, cache_size=50000):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def question_key(question):
+        return hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+
+    def score(self, question, documents):
+        question_key = self.question_key(question)
+        keys = [(question_key, document_id(doc)) for doc in documents]
+        scores = [None] * len(documents)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+            missing = [i for i, score in enumerate(scores) if score is None]
+            self.hits += len(documents) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            values = self.model.predict(
+                [(question, documents[i].page_content) for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            with self._lock:
+                for i, value in zip(missing, values):
+                    scores[i] = float(value)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, question, documents, top_n):
+        # top_n chunk có điểm cao nhất, giữ thứ tự truy xuất khi bằng điểm
+        if not documents:
+            return []
+        scores = self.score(question, documents)
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        return [documents[i] for i in order[:top_n]]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    # None khi tắt RERANK_ENABLED; model chỉ nạp một lần trong process, nạp lại nếu đổi RERANK_MODEL
+    global _reranker
+    if not config.RERANK_ENABLED:
+        return None
+    with _reranker_lock:
+        if _reranker is None or _reranker.model_name != config.RERANK_MODEL:
+            _reranker = Reranker(
+                config.RERANK_MODEL,
+                batch_size=config.RERANK_BATCH_SIZE,
+                max_length=config.RERANK_MAX_LENGTH,
+                cache_size=config.RERANK_CACHE_SIZE,
+            )
+        return _reranker
@@ -0,0 +1,72 @@
+import threading
+import numpy as np
+from app.vector_store import similarity_search_with_vectors
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class CandidatePool:
+    # Ứng viên dùng chung của một Điều/mục: các chunk và ma trận vector (đã chuẩn hoá) của chúng
+    def __init__(self, results):
+        self.documents = [doc for doc, _ in results]
+        self.matrix = normalize([vector for _, vector in results]) if results else None
+
+    def narrow(self, vector, k):
+        # k chunk gần câu hỏi nhất trong tập ứng viên, tính hoàn toàn cục bộ
+        if not self.documents:
+            return []
+        scores = self.matrix @ normalize(vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.documents[i] for i in top]
+
+
+class RetrievalPlan:
+    # Kế hoạch truy xuất cho một văn bản cần đánh giá: các mục lá cùng nhóm (cùng Điều, hoặc cùng mục 1.1 có
+    # mục con) dùng chung một tập ứng viên, lấy bằng một truy vấn vector store theo tâm các vector câu hỏi của nhóm.
+    # Nhóm chỉ có một mục lá thì truy xuất như bình thường.
+    def __init__(self, vectorstore, pool_size):
+        self.vectorstore = vectorstore
+        self.pool_size = pool_size
+        self.queries = 0
+        self._keys = {}
+        self._members = {}
+        self._pools = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def add(self, index, key, vector):
+        self._keys[index] = key
+        self._members.setdefault(key, []).append(vector)
+
+    def pool(self, index):
+        # Tập ứng viên của mục lá index (None nếu truy xuất riêng); nhóm được lấy một lần, lần đầu có mục lá cần
+        key = self._keys.get(index)
+        if key is None or len(self._members[key]) < 2:
+            return None
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                centroid = normalize(normalize(self._members[key]).mean(axis=0))
+                pool = CandidatePool(similarity_search_with_vectors(self.vectorstore, centroid, self.pool_size))
+                with self._lock:
+                    self.queries += 1
+                self._pools[key] = pool
+            return pool
+
+    def stats(self):
+        pooled = sum(len(members) for members in self._members.values() if len(members) > 1)
+        return {
+            "leaves": len(self._keys),
+            "pools": sum(1 for members in self._members.values() if len(members) > 1),
+            "pooled_leaves": pooled,
+            "pool_queries": self.queries,
+        }
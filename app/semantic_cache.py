@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import numpy as np
+from langchain.schema import Document
+from app.config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
+from app.embedding_cache import embedding_namespace
+
+
+def serialize_documents(documents):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def deserialize_documents(data):
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in data]
+
+
+class SemanticCache:
+    # Cache theo độ tương đồng: ma trận embedding câu hỏi (đã chuẩn hoá) trong RAM, lưu xuống đĩa dạng .npy + .json.
+    # File .json ghi model embedding (namespace) của các vector; khác model hiện tại thì bỏ cả cache vì vector của
+    # hai model không so được với nhau. Mỗi câu trả lời mang phiên bản prompt/LLM đã sinh ra nó (version), chỉ được
+    # dùng lại cho đúng phiên bản đó.
+    def __init__(self, path, threshold, max_entries, namespace, save_every=20):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._versions = np.empty(0, dtype=np.int32)
+        self._version_ids = {}
+        self._size = 0
+        self._entries = []
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.path + ".npy") and os.path.exists(self.path + ".json")):
+            return
+        try:
+            vectors = np.load(self.path + ".npy")
+            with open(self.path + ".json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Không đọc được semantic cache, bỏ qua: {str(e)}")
+            return
+        if not isinstance(data, dict) or data.get("namespace") != self.namespace:
+            print(f"Semantic cache được tạo bằng model embedding khác {self.namespace}, bỏ qua")
+            return
+        entries = data["entries"]
+        if len(vectors) != len(entries):
+            print("Semantic cache không khớp giữa vector và câu trả lời, bỏ qua")
+            return
+        self._vectors = vectors.astype(np.float32)
+        self._versions = np.asarray([self._version_id(entry["version"]) for entry in entries], dtype=np.int32)
+        self._size = len(entries)
+        self._entries = entries
+
+    def _version_id(self, version):
+        return self._version_ids.setdefault(version, len(self._version_ids))
+
+    def lookup(self, vector, version):
+        # Trả về (entry, score) của câu hỏi gần nhất cùng version nếu cosine >= threshold
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._size and version in self._version_ids:
+                scores = self._vectors[:self._size] @ query
+                scores[self._versions[:self._size] != self._version_ids[version]] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    entry = self._entries[best]
+                    return {
+                        "question": entry["question"],
+                        "answer": entry["answer"],
+                        "documents": deserialize_documents(entry["documents"]),
+                    }, float(scores[best])
+            self.misses += 1
+            return None
+
+    def add(self, question, vector, answer, documents, version):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.empty((64, vector.shape[0]), dtype=np.float32)
+            if self._size >= self.max_entries:
+                # Bỏ 10% bản ghi cũ nhất
+                drop = max(1, self.max_entries // 10)
+                self._vectors[:self._size - drop] = self._vectors[drop:self._size]
+                self._versions[:self._size - drop] = self._versions[drop:self._size]
+                self._entries = self._entries[drop:]
+                self._size -= drop
+            if self._size == len(self._vectors):
+                grown = np.empty((len(self._vectors) * 2, self._vectors.shape[1]), dtype=np.float32)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            if self._size >= len(self._versions):
+                self._versions = np.resize(self._versions, len(self._vectors))
+            self._vectors[self._size] = vector
+            self._versions[self._size] = self._version_id(version)
+            self._entries.append({
+                "question": question,
+                "answer": answer,
+                "documents": serialize_documents(documents),
+                "version": version,
+            })
+            self._size += 1
+            self._dirty += 1
+            if self._dirty >= self.save_every:
+                self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        np.save(self.path + ".tmp.npy", self._vectors[:self._size])
+        with open(self.path + ".tmp.json", "w", encoding="utf-8") as f:
+            json.dump({"namespace": self.namespace, "entries": self._entries}, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp.npy", self.path + ".npy")
+        os.replace(self.path + ".tmp.json", self.path + ".json")
+        self._dirty = 0
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._versions = np.empty(0, dtype=np.int32)
+            self._version_ids = {}
+            self._size = 0
+            self._entries = []
+            self._dirty = 0
+            for suffix in (".npy", ".json"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+        print("🧹 Đã xoá semantic cache")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "threshold": self.threshold,
+        }
+
+
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, embedding_namespace()
+) if SEMANTIC_CACHE_ENABLED else None
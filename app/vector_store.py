@@ -0,0 +1,374 @@
+import json
+import os
+import threading
+import time
+import uuid
+import numpy as np
+from langchain_core.vectorstores import VectorStore
+from langchain.schema import Document
+from langchain_pinecone import PineconeVectorStore
+from app import config
+
+
+class LocalVectorStore(VectorStore):
+    # Chỉ mục vector cục bộ, thay thế Pinecone khi chạy offline/test:
+    # - vectors.f32: ma trận float32 đã chuẩn hoá, chỉ ghi nối thêm, đọc bằng memory-map
+    # - docs.jsonl: id, text, metadata của từng dòng; xoá được ghi thành bản ghi {"deleted": id}
+    # Tìm kiếm cosine chính xác ("exact") hoặc xấp xỉ kiểu IVF ("ivf": k-means, chỉ thăm nprobe cụm gần nhất).
+    def __init__(self, directory, embedding=None, dim=None, search_type="exact", nlist=256, nprobe=16):
+        self.directory = directory
+        self.dim = dim or config.EMBEDDING_DIM
+        self.search_type = search_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._embedding = embedding
+        self._lock = threading.RLock()
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._row_by_id = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._ivf = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def docs_path(self):
+        return os.path.join(self.directory, "docs.jsonl")
+
+    def __len__(self):
+        return len(self._row_by_id)
+
+    def _load(self):
+        alive = []
+        if os.path.exists(self.docs_path):
+            with open(self.docs_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if "deleted" in record:
+                        row = self._row_by_id.pop(record["deleted"], None)
+                        if row is not None:
+                            alive[row] = False
+                        continue
+                    self._row_by_id[record["id"]] = len(self._ids)
+                    self._ids.append(record["id"])
+                    self._texts.append(record["text"])
+                    self._metadatas.append(record["metadata"])
+                    alive.append(True)
+        self._alive = np.array(alive, dtype=bool)
+        self._open_vectors()
+        if len(self._vectors) < len(self._ids):
+            raise ValueError(f"Chỉ mục {self.directory} bị hỏng: thiếu vector cho {len(self._ids) - len(self._vectors)} chunk")
+
+    def _open_vectors(self):
+        # Chỉ dùng số dòng đã có metadata, phần vector ghi dở (nếu có) bị bỏ qua
+        rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        rows = min(rows, len(self._ids)) if self._ids else 0
+        if rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        else:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        texts = list(texts)
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim))
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        if not texts:
+            return []
+        with self._lock:
+            # Upsert: bản cũ cùng id bị đánh dấu xoá trước khi ghi bản mới
+            self._delete_rows([i for i in ids if i in self._row_by_id])
+            # Cắt phần vector ghi dở của lần trước (nếu có) để dòng mới khớp với metadata
+            if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != len(self._ids) * 4 * self.dim:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(len(self._ids) * 4 * self.dim)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float32).tobytes())
+            with open(self.docs_path, "a", encoding="utf-8") as f:
+                for doc_id, text, metadata in zip(ids, texts, metadatas):
+                    f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+            start = len(self._ids)
+            for offset, doc_id in enumerate(ids):
+                self._row_by_id[doc_id] = start + offset
+            self._ids.extend(ids)
+            self._texts.extend(texts)
+            self._metadatas.extend(metadatas)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._open_vectors()
+            if self._ivf is not None:
+                self._ivf_assign(np.arange(start, start + len(ids)))
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self._lock:
+            self._delete_rows(ids)
+            dead = len(self._ids) - len(self._row_by_id)
+            if dead > 1000 and dead > 0.3 * len(self._ids):
+                self._compact()
+        return True
+
+    def _delete_rows(self, ids):
+        rows = []
+        with open(self.docs_path, "a", encoding="utf-8") as f:
+            for doc_id in ids:
+                row = self._row_by_id.pop(doc_id, None)
+                if row is None:
+                    continue
+                rows.append(row)
+                f.write(json.dumps({"deleted": doc_id}, ensure_ascii=False) + "\n")
+        if rows:
+            self._alive[rows] = False
+
+    def _compact(self):
+        # Ghi lại hai file chỉ với các dòng còn sống
+        rows = np.flatnonzero(self._alive)
+        vectors = np.asarray(self._vectors[rows])
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            f.write(vectors.tobytes())
+        with open(self.docs_path + ".tmp", "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({"id": self._ids[row], "text": self._texts[row],
+                                    "metadata": self._metadatas[row]}, ensure_ascii=False) + "\n")
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        os.replace(self.docs_path + ".tmp", self.docs_path)
+        self._ids = [self._ids[row] for row in rows]
+        self._texts = [self._texts[row] for row in rows]
+        self._metadatas = [self._metadatas[row] for row in rows]
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._open_vectors()
+        self._ivf = None
+
+    def _document(self, row):
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def get_by_ids(self, ids):
+        with self._lock:
+            return [self._document(self._row_by_id[doc_id]) for doc_id in ids if doc_id in self._row_by_id]
+
+    def get_vectors(self, ids):
+        # Vector đã lưu của các chunk (None nếu không có)
+        with self._lock:
+            return [np.array(self._vectors[self._row_by_id[doc_id]]) if doc_id in self._row_by_id else None
+                    for doc_id in ids]
+
+    def build_ivf(self):
+        # Huấn luyện k-means (cosine) trên một mẫu vector rồi gán mọi dòng vào cụm gần nhất
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            nlist = min(self.nlist, len(rows) // 8)
+            if nlist < 2:
+                self._ivf = None
+                return
+            rng = np.random.default_rng(0)
+            sample = rng.choice(rows, size=min(len(rows), nlist * 64), replace=False)
+            data = np.asarray(self._vectors[np.sort(sample)])
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+            for _ in range(10):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = data[assign == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = self._normalize(centroids)
+            self._ivf = {"centroids": centroids, "lists": [np.zeros(0, dtype=np.int64) for _ in range(nlist)], "trained": len(rows)}
+            self._ivf_assign(rows)
+
+    def _ivf_assign(self, rows):
+        centroids = self._ivf["centroids"]
+        lists = self._ivf["lists"]
+        for start in range(0, len(rows), 8192):
+            chunk = rows[start:start + 8192]
+            assign = np.argmax(np.asarray(self._vectors[chunk]) @ centroids.T, axis=1)
+            for c in np.unique(assign):
+                lists[c] = np.concatenate([lists[c], chunk[assign == c]])
+
+    def _ivf_candidates(self, query):
+        if self._ivf is None or len(self._row_by_id) > 2 * self._ivf["trained"]:
+            self.build_ivf()
+        if self._ivf is None:
+            return None
+        centroid_scores = self._ivf["centroids"] @ query
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        candidates = np.concatenate([self._ivf["lists"][c] for c in probe])
+        return candidates[self._alive[candidates]]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, search_type=None, **kwargs):
+        query = self._normalize(np.asarray(embedding, dtype=np.float32).reshape(self.dim))
+        with self._lock:
+            if not self._row_by_id:
+                return []
+            candidates = None
+            if (search_type or self.search_type) == "ivf":
+                candidates = self._ivf_candidates(query)
+            if candidates is None:
+                scores = np.asarray(self._vectors) @ query
+                scores[~self._alive[:len(scores)]] = -np.inf
+                rows = np.arange(len(scores))
+            else:
+                scores = np.asarray(self._vectors[np.sort(candidates)]) @ query
+                rows = np.sort(candidates)
+            k = min(k, int(np.isfinite(scores).sum()))
+            if k <= 0:
+                return []
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(-scores[top])]
+            return [(self._document(rows[i]), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Điểm đã là cosine similarity
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory=None, **kwargs):
+        store = cls(directory or config.LOCAL_INDEX_DIR, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+def upsert_embeddings(vectorstore, ids, texts, vectors, metadatas):
+    # Ghi các vector đã tính sẵn (không embed lại) vào backend đang dùng
+    if isinstance(vectorstore, LocalVectorStore):
+        return vectorstore.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+    # Pinecone không nhận metadata None; nội dung chunk lưu dưới text_key như PineconeVectorStore.add_texts
+    records = []
+    for chunk_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+        values = {key: value for key, value in metadata.items() if value is not None}
+        values[vectorstore._text_key] = text
+        records.append({"id": chunk_id, "values": [float(v) for v in vector], "metadata": values})
+    vectorstore.index.upsert(vectors=records, namespace=vectorstore._namespace)
+    return ids
+
+
+def delete_by_program(vectorstore, program, batch_size=1000, retries=10, wait=1.0):
+    # Xoá mọi vector có metadata program = tên văn bản, trả về số vector đã xoá. Dùng cho văn bản được học
+    # trước khi có manifest (ID ngẫu nhiên của from_documents, không tính lại được từ nội dung)
+    if isinstance(vectorstore, LocalVectorStore):
+        with vectorstore._lock:
+            ids = [doc_id for doc_id, row in vectorstore._row_by_id.items()
+                   if vectorstore._metadatas[row].get("program") == program]
+        vectorstore.delete(ids=ids)
+        return len(ids)
+    # Index serverless không xoá được theo bộ lọc metadata: tìm id theo bộ lọc rồi xoá theo id, đến khi truy vấn
+    # không còn kết quả nào. Kết quả truy vấn của Pinecone cập nhật chậm sau khi xoá nên một truy vấn có thể chỉ
+    # trả lại các id vừa xoá: khi đó chờ rồi thử lại (tối đa retries lần liên tiếp); vẫn còn thì báo lỗi để
+    # /learn không lưu manifest và lần sau dọn tiếp.
+    probe = [1.0] + [0.0] * (config.EMBEDDING_DIM - 1)
+    deleted = set()
+    stale = 0
+    while True:
+        response = vectorstore.index.query(
+            vector=probe,
+            top_k=batch_size,
+            filter={"program": {"$eq": program}},
+            include_values=False,
+            include_metadata=False,
+            namespace=vectorstore._namespace,
+        )
+        ids = [match["id"] for match in response["matches"]]
+        if not ids:
+            return len(deleted)
+        if deleted.issuperset(ids):
+            stale += 1
+            if stale > retries:
+                raise Exception(f"Vẫn còn vector cũ của {program} sau {retries} lần thử xoá "
+                                f"(đã xoá {len(deleted)})")
+            time.sleep(min(wait * stale, 10.0))
+            continue
+        stale = 0
+        vectorstore.index.delete(ids=ids, namespace=vectorstore._namespace)
+        deleted.update(ids)
+
+
+def similarity_search_with_vectors(vectorstore, vector, k):
+    # k chunk gần nhất kèm vector đã lưu của chúng, để chọn lại cục bộ mà không truy vấn hay embed thêm
+    if isinstance(vectorstore, LocalVectorStore):
+        documents = vectorstore.similarity_search_by_vector(vector, k=k)
+        vectors = vectorstore.get_vectors([doc.id for doc in documents])
+        return [(doc, v) for doc, v in zip(documents, vectors) if v is not None]
+    response = vectorstore.index.query(
+        vector=[float(v) for v in vector],
+        top_k=k,
+        include_values=True,
+        include_metadata=True,
+        namespace=vectorstore._namespace,
+    )
+    results = []
+    for match in response["matches"]:
+        metadata = dict(match["metadata"] or {})
+        text = metadata.pop(vectorstore._text_key, "")
+        results.append((Document(id=match["id"], page_content=text, metadata=metadata), match["values"]))
+    return results
+
+
+def index_namespace():
+    # Tên của chỉ mục vector đang dùng; các chỉ mục phụ (manifest, BM25, điều luật) tách theo tên này
+    # để đổi VECTOR_BACKEND không làm sai lệch trạng thái
+    index_name = config.PINECONE_INDEX_NAME if config.VECTOR_BACKEND == "pinecone" \
+        else os.path.basename(os.path.normpath(config.LOCAL_INDEX_DIR))
+    return f"{config.VECTOR_BACKEND}-{index_name}"
+
+
+# Mỗi thư mục chỉ mục cục bộ chỉ mở một lần trong process để ghi/đọc dùng chung
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def get_vectorstore(embedding):
+    # Chọn backend theo config.VECTOR_BACKEND: "pinecone" (mặc định) hoặc "local"
+    if config.VECTOR_BACKEND == "local":
+        with _local_stores_lock:
+            store = _local_stores.get(config.LOCAL_INDEX_DIR)
+            if store is None:
+                store = LocalVectorStore(
+                    config.LOCAL_INDEX_DIR,
+                    embedding,
+                    search_type=config.LOCAL_INDEX_SEARCH,
+                    nlist=config.IVF_NLIST,
+                    nprobe=config.IVF_NPROBE,
+                )
+                _local_stores[config.LOCAL_INDEX_DIR] = store
+            return store
+    if config.VECTOR_BACKEND != "pinecone":
+        raise ValueError(f"Unsupported VECTOR_BACKEND: {config.VECTOR_BACKEND}")
+    return PineconeVectorStore(
+        index_name=config.PINECONE_INDEX_NAME,
+        embedding=embedding,
+        pinecone_api_key=config.PINECONE_API_KEY
+    )
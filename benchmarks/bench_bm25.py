@@ -0,0 +1,55 @@
+# Đo chỉ mục BM25 của truy xuất kết hợp: thời gian dựng (chủ yếu là tách từ underthesea) và độ trễ tìm kiếm,
+# tách riêng phần tách từ câu hỏi (lần đầu) với phần tra chỉ mục (câu hỏi đã tách từ, nằm trong cache).
+# Chạy: python -m benchmarks.bench_bm25 --articles 2000
+# Dùng --document để dựng chỉ mục từ văn bản thật (tách chunk như /learn).
+import argparse
+import tempfile
+import time
+import numpy as np
+from app.bm25_index import BM25Index, tokenize_query
+from app.document_processor import iter_article_chunks, iter_learn_lines
+from benchmarks.bench_chunker import law_lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=2000, help="Số điều của văn bản giả lập")
+    parser.add_argument("--document", help="File PDF/DOCX thật thay cho văn bản giả lập")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    lines = iter_learn_lines(args.document) if args.document else law_lines(args.articles)
+    chunks = list(iter_article_chunks(lines, "bench"))
+    ids = [str(i) for i in range(len(chunks))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        index = BM25Index(tmp)
+        for i in range(0, len(chunks), 64):
+            batch = chunks[i:i + 64]
+            index.add(ids[i:i + 64], [c["text"] for c in batch], [c["metadata"] for c in batch])
+        build = time.perf_counter() - start
+        print(f"{len(chunks)} chunk, {index.stats()['terms']} từ: dựng {build:.1f}s ({len(chunks) / build:.0f} chunk/s)")
+
+        start = time.perf_counter()
+        BM25Index(tmp)
+        print(f"Nạp lại từ đĩa: {time.perf_counter() - start:.2f}s")
+
+        # Câu hỏi: đoạn đầu của các chunk rải đều trong văn bản, kèm trích dẫn "Điều N"
+        step = max(1, len(chunks) // args.queries)
+        queries = [f"{c['metadata']['article_title']} {c['text'][-200:]}" for c in chunks[::step][:args.queries]]
+        tokenize_query.cache_clear()
+        cold, warm = [], []
+        for timings in (cold, warm):
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query, args.k)
+                timings.append(time.perf_counter() - start)
+        for name, timings in (("tách từ + tra", cold), ("chỉ tra", warm)):
+            timings = np.asarray(timings) * 1000
+            print(f"{name:>14}: p50 {np.percentile(timings, 50):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# So sánh tách chunk theo ký tự (CHUNK_SIZE/CHUNK_OVERLAP) và theo token của EMBEDDING_MODEL:
+# tốc độ tách (chunk/s), số chunk, tổng token phải embed so với số token của văn bản, số chunk bị model cắt bớt.
+# Chạy: python -m benchmarks.bench_chunker --articles 2000
+# Dùng --document để đo trên văn bản thật (tách như /learn), --token-sizes để thử nhiều kích thước chunk token.
+import argparse
+import gc
+import time
+from app import config
+from app.document_processor import (
+    base_embeddings, create_text_splitter, iter_article_chunks, iter_learn_lines
+)
+
+
+def roman(number):
+    result = ""
+    for value, symbol in ((1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                          (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")):
+        while number >= value:
+            result += symbol
+            number -= value
+    return result
+
+
+def law_lines(articles, per_chapter=20):
+    # Văn bản luật giả lập: mỗi chương per_chapter điều, độ dài điều thay đổi để có cả điều ngắn lẫn điều dài
+    for number in range(1, articles + 1):
+        if number % per_chapter == 1:
+            yield f"Chương {roman(number // per_chapter + 1)}. Quy định về nhóm nội dung {number // per_chapter + 1}\n"
+        yield f"Điều {number}. Trách nhiệm của cơ quan, tổ chức trong trường hợp số {number}\n"
+        for clause in range(1, number % 5 + 2):
+            yield (f"{clause}. Cơ quan có thẩm quyền có trách nhiệm hướng dẫn, kiểm tra việc thực hiện "
+                   f"quy định tại khoản {clause} Điều {number} của Luật này và báo cáo định kỳ.\n")
+            for point in "abc"[:number % 3 + 1]:
+                yield f"{point}) Trường hợp áp dụng {point} theo quy định của Chính phủ.\n"
+
+
+def timed(fn, *args):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn(*args)
+        return time.perf_counter() - start, result
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=2000, help="Số điều của văn bản giả lập")
+    parser.add_argument("--document", help="File PDF/DOCX thật thay cho văn bản giả lập")
+    parser.add_argument("--token-sizes", type=int, nargs="+", default=[config.CHUNK_TOKEN_SIZE],
+                        help="Kích thước chunk theo token (0 = cửa sổ của model)")
+    parser.add_argument("--token-overlap", type=int, default=config.CHUNK_TOKEN_OVERLAP)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = list(iter_learn_lines(args.document)) if args.document else list(law_lines(args.articles))
+    model = base_embeddings.client
+    window = model.max_seq_length
+    corpus_tokens = sum(len(model.tokenizer.tokenize(line)) for line in lines)
+    print(f"{len(lines)} dòng, {corpus_tokens} token, cửa sổ model {window} token")
+
+    splitters = [(f"chars {config.CHUNK_SIZE}/{config.CHUNK_OVERLAP}", lambda: create_text_splitter("chars"))]
+    for size in args.token_sizes:
+        name = f"tokens {size or window - 2}/{args.token_overlap}"
+        splitters.append((name, lambda size=size: create_text_splitter("tokens", size, args.token_overlap)))
+
+    print(f"{'cách tách':>16} {'chunk':>7} {'chunk/s':>9} {'token embed':>12} {'/văn bản':>9} {'bị cắt':>7}")
+    for name, make_splitter in splitters:
+        best = None
+        for _ in range(args.repeat):
+            # Tạo bộ tách mới mỗi lần để không tính cache độ dài token của lần trước
+            elapsed, chunks = timed(lambda: list(iter_article_chunks(iter(lines), "bench", make_splitter())))
+            best = elapsed if best is None else min(best, elapsed)
+        # Số token model thực sự đọc: cộng 2 token đặc biệt, phần vượt cửa sổ bị model bỏ
+        lengths = [len(model.tokenizer.tokenize(chunk["text"])) + 2 for chunk in chunks]
+        embedded = sum(min(length, window) for length in lengths)
+        truncated = sum(length > window for length in lengths)
+        print(f"{name:>16} {len(chunks):>7} {len(chunks) / best:>9.0f} {embedded:>12} "
+              f"{embedded / corpus_tokens:>8.2f}x {truncated:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Đo thời gian parse điều khoản (parse_structured_terms) trên hợp đồng giả lập với số trang tăng dần,
+# để kiểm tra thời gian tăng tuyến tính theo số trang (ms/trang gần như không đổi).
+# Chạy: python -m benchmarks.bench_clause_parser --pages 250 500 1000 2000
+# Thêm --pdf để đo cả extract_structured_terms trên file PDF thật (cần font có dấu tiếng Việt, ví dụ DejaVuSans).
+import argparse
+import gc
+import os
+import tempfile
+import time
+from app import loaders
+from app.document_processor import parse_structured_terms, extract_structured_terms
+
+
+def page_lines(page):
+    # Mỗi trang một điều, gồm mục 1.1, a), ii), gạch đầu dòng và các dòng nối tiếp
+    number = page + 1
+    lines = [f"Điều {number}. Quy định về quyền và nghĩa vụ của các bên số {number}"]
+    for sub in range(1, 4):
+        lines.append(f"{number}.{sub} Bên A có trách nhiệm thực hiện nội dung {sub} theo hợp đồng này")
+        lines.append("và các phụ lục kèm theo nếu có.")
+        for detail in "abc":
+            lines.append(f"{detail}) Trường hợp {detail} áp dụng khi các bên thoả thuận bằng văn bản")
+            lines.append("ii) Nội dung bổ sung thứ hai")
+            lines.append("- Gạch đầu dòng mô tả chi tiết")
+            lines.append("phần nối tiếp của gạch đầu dòng")
+    return lines
+
+
+def make_pdf(path, pages, fontfile):
+    import fitz
+    doc = fitz.open()
+    for page in range(pages):
+        pdf_page = doc.new_page()
+        pdf_page.insert_font(fontname="vn", fontfile=fontfile)
+        pdf_page.insert_text((40, 40), "\n".join(page_lines(page)), fontname="vn", fontsize=7)
+    doc.save(path)
+    doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[250, 500, 1000, 2000])
+    parser.add_argument("--repeat", type=int, default=3, help="Lấy thời gian nhỏ nhất qua số lần chạy")
+    parser.add_argument("--pdf", action="store_true", help="Đo cả extract_structured_terms trên PDF giả lập")
+    parser.add_argument("--fontfile", default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+    args = parser.parse_args()
+    # Tắt cache text trích xuất để mỗi lần đo PDF đều đọc lại file
+    loaders.extract_cache = None
+
+    print(f"{'trang':>6} {'dòng':>8} {'parse (s)':>10} {'ms/trang':>9}" + (f" {'PDF (s)':>9} {'ms/trang':>9}" if args.pdf else ""))
+    baseline = None
+    for pages in args.pages:
+        lines = [line for page in range(pages) for line in page_lines(page)]
+        best = min(timed(parse_structured_terms, lines) for _ in range(args.repeat))
+        per_page = best / pages * 1000
+        baseline = baseline or per_page
+        row = f"{pages:>6} {len(lines):>8} {best:>10.3f} {per_page:>9.3f}"
+        if args.pdf:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "contract.pdf")
+                make_pdf(path, pages, args.fontfile)
+                pdf_best = min(timed(extract_structured_terms, path, 1, pages) for _ in range(args.repeat))
+            row += f" {pdf_best:>9.3f} {pdf_best / pages * 1000:>9.3f}"
+        print(row)
+    print(f"ms/trang ở {args.pages[-1]} trang so với {args.pages[0]} trang: {per_page / baseline:.2f}x (≈1 là tuyến tính)")
+
+
+def timed(fn, *args):
+    # Tắt GC trong lúc đo như timeit để số liệu không lệch vì các lần dọn rác ngẫu nhiên
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Đo recall@k và độ trễ của chỉ mục cục bộ: tìm chính xác (exact) so với IVF với các giá trị nprobe khác nhau.
+# Mặc định dùng dữ liệu tổng hợp dạng cụm; --index-dir để đo trên chỉ mục thật (truy vấn = vector có sẵn + nhiễu).
+# Chạy: python -m benchmarks.bench_local_index --n 100000 --queries 200
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+from app.vector_store import LocalVectorStore
+
+
+def synthetic_vectors(n, dim, clusters, rng):
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_queries(store, queries, k, search_type):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(query, k, search_type=search_type)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({doc.id for doc in docs})
+    latencies.sort()
+    return results, np.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--index-dir", default=None, help="Chỉ mục thật đã có (mặc định: tạo dữ liệu tổng hợp)")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    temp_dir = None
+    if args.index_dir:
+        store = LocalVectorStore(args.index_dir, nlist=args.nlist)
+        rows = rng.choice(np.flatnonzero(store._alive), size=args.queries)
+        base = np.asarray(store._vectors[rows])
+    else:
+        temp_dir = tempfile.mkdtemp()
+        store = LocalVectorStore(temp_dir, dim=args.dim, nlist=args.nlist)
+        vectors = synthetic_vectors(args.n, args.dim, max(16, args.n // 500), rng)
+        start = time.perf_counter()
+        for i in range(0, args.n, 10000):
+            ids = [str(j) for j in range(i, min(i + 10000, args.n))]
+            store.add_embeddings(ids, vectors[i:i + 10000], [{} for _ in ids], ids)
+        print(f"Nạp {args.n} vector: {time.perf_counter() - start:.1f}s")
+        base = vectors[rng.choice(args.n, size=args.queries)]
+    queries = base + 0.05 * rng.normal(size=base.shape).astype(np.float32)
+
+    try:
+        exact, p50, p99 = run_queries(store, queries, args.k, "exact")
+        print(f"exact          : p50={p50:.2f}ms p99={p99:.2f}ms recall@{args.k}=1.000")
+
+        start = time.perf_counter()
+        store.build_ivf()
+        print(f"Huấn luyện IVF (nlist={args.nlist}): {time.perf_counter() - start:.1f}s")
+        for nprobe in args.nprobe:
+            store.nprobe = nprobe
+            approx, p50, p99 = run_queries(store, queries, args.k, "ivf")
+            recall = np.mean([len(a & e) / len(e) for a, e in zip(approx, exact) if e])
+            print(f"ivf nprobe={nprobe:<3}: p50={p50:.2f}ms p99={p99:.2f}ms recall@{args.k}={recall:.3f}")
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Đo độ trễ /login (p50/p99) khi server rảnh và khi đang có một job /process chạy.
+# LLM và retrieval được thay bằng bản giả lập tốn CPU/I/O, không gọi Gemini hay Pinecone.
+# Chạy: python -m benchmarks.bench_login_latency --requests 50
+import argparse
+import hashlib
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uvicorn
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+def fake_page(i):
+    # Đọc + parse giả lập một trang: CPU thuần Python
+    sum(j * j for j in range(200000))
+    return {"title": f"Điều {i + 1}. Điều khoản", "sub_items": [
+        {"title": f"{i + 1}.{k + 1} Nội dung", "details": []} for k in range(5)
+    ]}
+
+
+def fake_extract(file_path, start_page, end_page, executor=None):
+    # Như extract_structured_terms: phần tốn CPU chạy trên process pool của API (executor=cpu_executor)
+    if executor is None:
+        return [fake_page(i) for i in range(40)]
+    return list(executor.map(fake_page, range(40)))
+
+
+def fake_answer_question(question, qa_chain, vector=None, pool=None):
+    # Embedding giả lập (hashlib nhả GIL như torch) + độ trễ mạng của LLM
+    data = question.encode() * 200000
+    for _ in range(5):
+        hashlib.sha256(data).hexdigest()
+    time.sleep(0.2)
+    return "phù hợp", [], None
+
+
+def request(method, path, data=None, token=None):
+    headers = {}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    body = None
+    if data is not None:
+        body = urllib.parse.urlencode(data).encode()
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    req = urllib.request.Request(BASE_URL + path, data=body, headers=headers, method=method)
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read())
+
+
+def login():
+    return request("POST", "/login", {"username": "user", "password": "user123"})["access_token"]
+
+
+def measure(n, until=None):
+    # Ít nhất n lần đăng nhập; có until thì đo thêm từng đợt 10 lần cho tới khi until() đúng
+    latencies = []
+    while len(latencies) < n or (until and not until()):
+        for _ in range(n if not latencies else 10):
+            start = time.perf_counter()
+            login()
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-ratio", type=float, default=2.0, help="p99 khi có job / p99 khi rảnh tối đa cho phép")
+    args = parser.parse_args()
+
+    # Nạp API ở đây chứ không ở đầu module: process pool dùng spawn, worker chỉ import module này để chạy fake_page
+    from app import api
+    api.extract_structured_terms = fake_extract
+    api.answer_question = fake_answer_question
+    api.embed_questions = lambda questions: [None] * len(questions)
+    api.get_qa_chain = lambda: None
+    api.create_retrieval_plan = lambda qa: None
+    api.warm_up = lambda: None
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.1)
+
+    token = login()
+    idle_p50, idle_p99 = measure(args.requests)
+    print(f"Rảnh:         p50={idle_p50:.1f}ms p99={idle_p99:.1f}ms")
+
+    params = {"file_path": "document/test_20250613_170224.docx", "start_page": 1, "end_page": 1}
+    job_id = request("POST", "/process?" + urllib.parse.urlencode(params), {}, token)["job_id"]
+    time.sleep(1)
+
+    def leaves_started():
+        # Đo cả lúc trích xuất (process pool) lẫn lúc đánh giá mục lá (luồng QA), dừng nếu job đã kết thúc
+        status = request("GET", f"/jobs/{job_id}", token=token)
+        return status["done"] > 0 or status["status"] != "running"
+
+    busy_p50, busy_p99 = measure(args.requests, until=leaves_started)
+    status = request("GET", f"/jobs/{job_id}", token=token)
+    print(f"Đang có job:  p50={busy_p50:.1f}ms p99={busy_p99:.1f}ms "
+          f"(job {status['status']}, {status['done']}/{status['total']} mục)")
+    request("DELETE", f"/jobs/{job_id}", token=token)
+    server.should_exit = True
+
+    # Job đã lỗi hoặc xong trước khi đo xong, hoặc chưa đánh giá được mục lá nào, thì số đo "đang có job"
+    # không chứng minh được gì
+    if status["status"] != "running" or not status["done"]:
+        print(f"❌ Job không chạy tới bước đánh giá mục lá: {status['status']} {status['error'] or ''}")
+        sys.exit(1)
+
+    ratio = busy_p99 / idle_p99
+    print(f"Tỉ lệ p99: {ratio:.2f} (ngưỡng {args.max_ratio})")
+    sys.exit(0 if ratio <= args.max_ratio else 1)
+
+
+if __name__ == "__main__":
+    main()
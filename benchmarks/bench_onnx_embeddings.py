@@ -0,0 +1,90 @@
+# So sánh backend embedding "torch" (fp32) và "onnx-int8": độ lệch vector, recall@5 khi truy xuất và tốc độ.
+# Chạy: python -m benchmarks.bench_onnx_embeddings --document document/luat.docx --questions json_output/output.json
+import argparse
+import json
+import time
+import numpy as np
+from app import config
+from app.embedding_backend import create_embeddings
+from app.document_processor import iter_article_chunks, iter_learn_lines
+from benchmarks.bench_question_embedding import iter_questions
+
+
+def load_chunks(path):
+    return [chunk["text"] for chunk in iter_article_chunks(iter_learn_lines(path), document_name=path)]
+
+
+def load_questions(path, chunks, limit):
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        items = data if isinstance(data, list) else [data]
+        questions = [q for item in items for q in iter_questions(item)]
+    else:
+        # Không có file câu hỏi: dùng dòng đầu của các chunk (tên điều) làm câu hỏi
+        questions = [chunk.splitlines()[0] for chunk in chunks]
+    return questions[:limit]
+
+
+def measure(embeddings, chunks, questions):
+    embeddings.embed_query("khởi động")
+    start = time.perf_counter()
+    chunk_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    chunk_time = time.perf_counter() - start
+
+    latencies = []
+    question_vectors = []
+    for question in questions:
+        start = time.perf_counter()
+        question_vectors.append(embeddings.embed_query(question))
+        latencies.append(time.perf_counter() - start)
+    return chunk_vectors, np.asarray(question_vectors, dtype=np.float32), chunk_time, np.asarray(latencies)
+
+
+def top_k(question_vectors, chunk_vectors, k):
+    scores = question_vectors @ chunk_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--document", required=True, help="File PDF/DOCX dùng làm corpus (tách chunk như /learn)")
+    parser.add_argument("--questions", help="File JSON đầu ra của extract_structured_terms, dùng làm câu hỏi")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--limit", type=int, default=500, help="Số câu hỏi tối đa")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.document)
+    questions = load_questions(args.questions, chunks, args.limit)
+    print(f"{len(chunks)} chunk, {len(questions)} câu hỏi")
+
+    results = {}
+    for backend in ("torch", "onnx-int8"):
+        embeddings = create_embeddings(backend, args.model)
+        results[backend] = measure(embeddings, chunks, questions)
+        del embeddings
+
+    fp32_chunks, fp32_questions, fp32_time, fp32_latency = results["torch"]
+    int8_chunks, int8_questions, int8_time, int8_latency = results["onnx-int8"]
+
+    # Vector đã chuẩn hoá nên tích vô hướng chính là cosine
+    agreement = np.sum(fp32_chunks * int8_chunks, axis=1)
+    print(f"Cosine fp32/int8 trên chunk: trung bình {agreement.mean():.4f}, "
+          f"p1 {np.percentile(agreement, 1):.4f}, nhỏ nhất {agreement.min():.4f}")
+
+    # recall@k: tỉ lệ top-k của int8 trùng với top-k của fp32 (lấy fp32 làm chuẩn)
+    k = min(args.k, len(chunks))
+    reference = top_k(fp32_questions, fp32_chunks, k)
+    candidate = top_k(int8_questions, int8_chunks, k)
+    recall = np.mean([len(set(r) & set(c)) / k for r, c in zip(reference, candidate)])
+    print(f"Recall@{k} so với fp32: {recall:.4f}")
+
+    for name, chunk_time, latency in (("torch", fp32_time, fp32_latency), ("onnx-int8", int8_time, int8_latency)):
+        print(f"{name:10s} {len(chunks) / chunk_time:8.1f} chunk/s | câu hỏi p50 {np.percentile(latency, 50) * 1000:.1f} ms, "
+              f"p95 {np.percentile(latency, 95) * 1000:.1f} ms")
+    print(f"Tăng tốc embed chunk: {fp32_time / int8_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# So sánh đọc text PDF tuần tự và song song trên process pool theo số trang, để chọn PDF_PARALLEL_MIN_PAGES.
+# Chạy: python -m benchmarks.bench_pdf_extraction --pages 16 32 64 128 512 2000 --workers 4
+# Dùng --pdf để đo trên một file thật (lấy các phạm vi 1..N trang của file đó).
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app import loaders
+from app.loaders import iter_pages
+from benchmarks.bench_clause_parser import make_pdf
+
+
+def read_all(path, pages, executor):
+    return list(iter_pages(path, 1, pages, executor))
+
+
+def best_time(repeat, fn, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[16, 32, 64, 128, 512, 2000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-task", type=int, default=loaders.PDF_PAGES_PER_TASK)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pdf", help="File PDF thật; mặc định tạo hợp đồng giả lập")
+    parser.add_argument("--fontfile", default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+    args = parser.parse_args()
+
+    # Đo riêng đường song song: bỏ ngưỡng tự động, chỉ dùng kích thước đoạn trang theo tham số;
+    # tắt cache text trích xuất để lần nào cũng đọc lại file
+    loaders.PDF_PARALLEL_MIN_PAGES = 1
+    loaders.PDF_PAGES_PER_TASK = args.pages_per_task
+    loaders.extract_cache = None
+
+    with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor(max_workers=args.workers) as executor:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(tmp, "contract.pdf")
+            make_pdf(path, max(args.pages), args.fontfile)
+        # Khởi động sẵn các process để không tính thời gian fork vào lần đo đầu tiên
+        list(executor.map(abs, range(args.workers)))
+
+        print(f"{args.workers} process, {args.pages_per_task} trang/lần gửi")
+        print(f"{'trang':>6} {'tuần tự (s)':>12} {'song song (s)':>14} {'tăng tốc':>9}")
+        cutoff = None
+        for pages in args.pages:
+            serial_time, serial = best_time(args.repeat, read_all, path, pages, None)
+            parallel_time, parallel = best_time(args.repeat, read_all, path, pages, executor)
+            if serial != parallel:
+                raise SystemExit(f"Kết quả song song khác tuần tự ở {pages} trang")
+            speedup = serial_time / parallel_time
+            if cutoff is None and speedup > 1.2:
+                cutoff = pages
+            print(f"{pages:>6} {serial_time:>12.3f} {parallel_time:>14.3f} {speedup:>8.2f}x")
+
+    if cutoff:
+        print(f"Song song bắt đầu có lợi (>1.2x) từ khoảng {cutoff} trang: cân nhắc PDF_PARALLEL_MIN_PAGES={cutoff}")
+    else:
+        print("Song song chưa có lợi ở các số trang đã đo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# So sánh thời gian embed câu hỏi của một văn bản: từng câu (cách cũ) và theo lô (pre-pass trong process_json).
+# Chạy: EMBEDDING_CACHE_ENABLED=false python -m benchmarks.bench_question_embedding --input json_output/output.json
+# (tắt cache embedding để đo thời gian embed thật)
+import argparse
+import json
+import time
+import numpy as np
+from app.document_processor import embeddings
+from app.qa_chain import embed_questions
+
+
+def iter_questions(item, parent_title=""):
+    # Dựng câu hỏi giống process_json: "Điều 1 > 1.1 > a) > i)"
+    title = item.get("title", "")
+    full_title = f"{parent_title} > {title}" if parent_title else title
+    children = item.get("sub_items") or item.get("details") or item.get("sub_details") or []
+    if not children:
+        yield full_title
+        return
+    for child in children:
+        yield from iter_questions(child if isinstance(child, dict) else {"title": child}, full_title)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="json_output/output.json", help="File JSON đầu ra của extract_structured_terms")
+    parser.add_argument("--repeat", type=int, default=1, help="Nhân bản danh sách câu hỏi để mô phỏng văn bản dài hơn")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data if isinstance(data, list) else [data]
+    questions = [q for item in items for q in iter_questions(item)] * args.repeat
+    print(f"{len(questions)} câu hỏi")
+
+    embeddings.embed_query("khởi động")
+
+    start = time.perf_counter()
+    single = [embeddings.embed_query(q) for q in questions]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = embed_questions(questions)
+    batched_time = time.perf_counter() - start
+
+    agreement = float(np.min(np.sum(np.asarray(single) * np.asarray(batched), axis=1)))
+    print(f"Từng câu: {single_time:.2f}s ({single_time / len(questions) * 1000:.1f} ms/câu)")
+    print(f"Theo lô:  {batched_time:.2f}s ({batched_time / len(questions) * 1000:.1f} ms/câu), "
+          f"nhanh hơn {single_time / batched_time:.1f}x")
+    print(f"Cosine nhỏ nhất giữa hai cách: {agreement:.6f}")
+
+
+if __name__ == "__main__":
+    main()
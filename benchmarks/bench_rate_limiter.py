@@ -0,0 +1,74 @@
+# Benchmark limiter LLM với một LLM giả lập (không gọi Gemini thật).
+# Chạy: python -m benchmarks.bench_rate_limiter --rpm 120 --calls 60 --workers 8
+import argparse
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.rate_limiter import RateLimiter, call_with_retry
+
+
+class StubLLM:
+    # Giả lập API: mỗi lượt mất `latency` giây, trả lỗi 429 nếu vượt `server_rpm` trong cửa sổ 60s
+    def __init__(self, server_rpm, latency):
+        self.server_rpm = server_rpm
+        self.latency = latency
+        self.calls = deque()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, question):
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] >= 60:
+                self.calls.popleft()
+            if len(self.calls) >= self.server_rpm:
+                self.rejected += 1
+                raise Exception("429 Resource has been exhausted (e.g. check quota).")
+            self.calls.append(now)
+        time.sleep(self.latency)
+        return {"result": f"Trả lời: {question}", "source_documents": []}
+
+
+def run(rpm, server_rpm, calls, workers, latency, burst):
+    llm = StubLLM(server_rpm, latency)
+    limiter = RateLimiter(rpm, burst)
+
+    def call(i):
+        try:
+            call_with_retry(lambda: llm(f"Điều {i}"), limiter=limiter, max_retries=10)
+            return True
+        except Exception:
+            return False
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        succeeded = sum(executor.map(call, range(calls)))
+    elapsed = time.monotonic() - start
+    return elapsed, succeeded, llm.rejected, limiter.current_rpm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rpm", type=int, default=120, help="RPM cấu hình cho limiter")
+    parser.add_argument("--server-rpm", type=int, default=None, help="Quota thật của API giả lập (mặc định = --rpm)")
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="Độ trễ mỗi lượt gọi LLM giả lập (giây)")
+    parser.add_argument("--burst", type=int, default=1)
+    args = parser.parse_args()
+    server_rpm = args.server_rpm or args.rpm
+
+    elapsed, succeeded, rejected, final_rpm = run(args.rpm, server_rpm, args.calls, args.workers, args.latency, args.burst)
+    achieved = succeeded / elapsed * 60
+    print(f"Limiter: {succeeded}/{args.calls} lượt thành công trong {elapsed:.1f}s -> {achieved:.1f} RPM "
+          f"(cấu hình {args.rpm} RPM, quota API {server_rpm} RPM, {rejected} lượt bị 429, "
+          f"tốc độ cuối {final_rpm:.1f} RPM)")
+
+    # Mốc so sánh: sleep cố định 5s trước mỗi lượt gọi như cách cũ, chạy tuần tự
+    baseline = args.calls * (5 + args.latency)
+    print(f"Sleep cố định 5s (tuần tự): ước tính {baseline:.1f}s -> {args.calls / baseline * 60:.1f} RPM")
+
+
+if __name__ == "__main__":
+    main()
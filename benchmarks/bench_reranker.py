@@ -0,0 +1,59 @@
+# Ngân sách độ trễ của bước xếp hạng lại: thời gian cross-encoder chấm RERANK_CANDIDATES chunk cho mỗi điều khoản,
+# theo số ứng viên và kích thước lô, lần đầu (chưa có trong cache điểm) và lần lặp lại (trúng cache).
+# Chạy: python -m benchmarks.bench_reranker --candidates 10 20 30 --batch-sizes 8 16 32
+# Dùng --document để lấy chunk từ văn bản thật (tách như /learn).
+import argparse
+import time
+import numpy as np
+from langchain.schema import Document
+from app import config
+from app.reranker import Reranker
+from app.document_processor import iter_article_chunks, iter_learn_lines
+from benchmarks.bench_chunker import law_lines
+from benchmarks.bench_clause_parser import page_lines
+
+
+def percentiles(timings):
+    timings = np.asarray(timings) * 1000
+    return f"p50 {np.percentile(timings, 50):7.1f} ms, p95 {np.percentile(timings, 95):7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--document", help="File PDF/DOCX thật thay cho văn bản giả lập")
+    parser.add_argument("--model", default=config.RERANK_MODEL)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 20, config.RERANK_CANDIDATES])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[config.RERANK_BATCH_SIZE])
+    parser.add_argument("--clauses", type=int, default=20, help="Số điều khoản đo cho mỗi cấu hình")
+    args = parser.parse_args()
+
+    lines = iter_learn_lines(args.document) if args.document else law_lines(500)
+    documents = [
+        Document(page_content=chunk["text"], metadata={**chunk["metadata"], "chunk_id": str(i)})
+        for i, chunk in enumerate(iter_article_chunks(lines, "bench"))
+    ]
+    # Điều khoản cần đánh giá: các dòng 1.1, a), ... của hợp đồng giả lập
+    clauses = [line for page in range(args.clauses) for line in page_lines(page)[1:2]]
+    rng = np.random.default_rng(0)
+    print(f"{len(documents)} chunk, {len(clauses)} điều khoản, model {args.model}")
+
+    reranker = Reranker(args.model, max_length=config.RERANK_MAX_LENGTH)
+    reranker.rerank("khởi động", documents[:4], 1)
+    for batch_size in args.batch_sizes:
+        reranker.batch_size = batch_size
+        for count in args.candidates:
+            reranker._cache.clear()
+            pools = [[documents[i] for i in rng.choice(len(documents), size=min(count, len(documents)), replace=False)]
+                     for _ in clauses]
+            cold, warm = [], []
+            for timings in (cold, warm):
+                for clause, pool in zip(clauses, pools):
+                    start = time.perf_counter()
+                    reranker.rerank(clause, pool, config.RERANK_TOP_N)
+                    timings.append(time.perf_counter() - start)
+            print(f"lô {batch_size:>3}, {count:>3} ứng viên | chưa cache: {percentiles(cold)} "
+                  f"({count / np.median(cold):.0f} cặp/s) | trúng cache: {percentiles(warm)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -248,6 +248,20 @@ const UserPage: React.FC = () => {
     }
   };
 
+  const waitForJob = async (jobId: string): Promise<any> => {
+    while (true) {
+      const response = await api.get(`/jobs/${jobId}`);
+      const job = response.data;
+      if (job.status === "completed") {
+        return job;
+      }
+      if (job.status === "failed" || job.status === "cancelled") {
+        throw { response: { data: { detail: job.error || `Job ${job.status}` } } };
+      }
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleProcess = async () => {
     if (!selectedFileForProcess) return;
 
@@ -267,9 +281,10 @@ const UserPage: React.FC = () => {
         },
       });
 
-      processPromise.then(response => {
-        setProcessingResults(response.data.results);
-        setProcessingTime(response.data.process_time);
+      // /process chỉ trả về job_id, theo dõi tiến độ cho tới khi job kết thúc
+      processPromise.then(response => waitForJob(response.data.job_id)).then(job => {
+        setProcessingResults(job.result.results);
+        setProcessingTime(job.result.processing_time);
         setSuccess("File processed successfully");
         setResultsDialogOpen(true);
       }).catch(err => {
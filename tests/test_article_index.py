@@ -0,0 +1,51 @@
+from app.article_index import ArticleIndex
+
+
+def make_index(tmp_path):
+    index = ArticleIndex(str(tmp_path))
+    for program in ("Bo_luat_dan_su_2015.pdf", "Luat_Dat_dai_2024.docx"):
+        index.replace(program, [
+            (f"{program}-{number}-{part}", f"Điều {number}. nội dung {part}",
+             {"program": program, "article_number": str(number)})
+            for number in range(1, 21) for part in range(5)
+        ])
+    return index
+
+
+def cited(index, question):
+    return [(doc.metadata["program"], doc.metadata["article_number"]) for doc in index.lookup(question, limit=5)]
+
+
+def test_contract_heading_is_not_a_citation(tmp_path):
+    index = make_index(tmp_path)
+    question = "Điều 3: Quyền và nghĩa vụ của bên thuê > 3.1 Bên thuê sử dụng tài sản theo quy định của Bộ luật Dân sự"
+    assert cited(index, question) == []
+    assert cited(index, "Điều 3: Quyền và nghĩa vụ\n3.1 Bên thuê tuân thủ Bộ luật Dân sự") == []
+
+
+def test_law_named_far_from_article_is_not_a_citation(tmp_path):
+    index = make_index(tmp_path)
+    question = "Bên B thực hiện Điều 5 của hợp đồng này đúng thời hạn và tuân thủ Luật Đất đai"
+    assert cited(index, question) == []
+
+
+def test_explicit_citations(tmp_path):
+    index = make_index(tmp_path)
+    assert set(cited(index, "Điều 4: Giá thuê > 4.1 Theo Điều 12 Luật Đất đai năm 2024")) == {
+        ("Luat_Dat_dai_2024.docx", "12")}
+    assert set(cited(index, "Áp dụng Điều 3, Điều 4 của Bộ luật Dân sự")) == {
+        ("Bo_luat_dan_su_2015.pdf", "3"), ("Bo_luat_dan_su_2015.pdf", "4")}
+
+
+def test_reload_and_relearn(tmp_path):
+    make_index(tmp_path)
+    index = ArticleIndex(str(tmp_path))
+    documents = index.get("Luat_Dat_dai_2024.docx", 12)
+    assert [doc.page_content for doc in documents] == [f"Điều 12. nội dung {part}" for part in range(5)]
+    assert documents[0].id == "Luat_Dat_dai_2024.docx-12-0"
+    index.replace("Luat_Dat_dai_2024.docx", [
+        ("new-1", "Điều 1. nội dung mới", {"program": "Luat_Dat_dai_2024.docx", "article_number": "1"}),
+        ("intro", "Lời nói đầu", {"program": "Luat_Dat_dai_2024.docx", "article_number": None}),
+    ])
+    assert index.get("Luat_Dat_dai_2024.docx", 12) == []
+    assert [doc.id for doc in ArticleIndex(str(tmp_path)).get("Luat_Dat_dai_2024.docx", 1)] == ["new-1"]